@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Benchmark of batch password hashing against the number of threads
+
+Results are printed as one JSON object per line.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Iterator
+import encrypt_password
+
+
+def scaling(count: int, max_workers: int) -> Iterator[dict]:
+    """
+    Time hash_passwords and verify_many for 1 .. ``max_workers`` threads.
+
+    Args:
+        count (int): Number of passwords per run.
+        max_workers (int): Largest pool size measured.
+
+    Returns:
+        Iterator[dict]: One result per pool size.
+    """
+    passwords = ['password-{}'.format(i) for i in range(count)]
+    baseline = None
+    for workers in range(1, max_workers + 1):
+        start = time.perf_counter()
+        hashes = list(encrypt_password.hash_passwords(passwords, workers))
+        hashed = time.perf_counter() - start
+        start = time.perf_counter()
+        valid = list(encrypt_password.verify_many(zip(hashes, passwords),
+                                                  workers))
+        verified = time.perf_counter() - start
+        assert all(valid)
+        baseline = baseline or hashed
+        yield {
+            'workers': workers,
+            'passwords': count,
+            'hash_per_sec': count / hashed,
+            'verify_per_sec': count / verified,
+            'speedup': baseline / hashed,
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--count', type=int, default=64)
+    parser.add_argument('--max-workers', type=int,
+                        default=os.cpu_count() or 1)
+    args = parser.parse_args()
+    for result in scaling(args.count, args.max_workers):
+        json.dump(result, sys.stdout)
+        sys.stdout.write('\n')
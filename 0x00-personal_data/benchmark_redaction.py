@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the redaction paths of filtered_logger
+
+Results are printed as one JSON object per line.
+"""
+import argparse
+import io
+import itertools
+import json
+import logging
+import sqlite3
+import sys
+import time
+from typing import Callable, Iterator, List, Sequence, Tuple
+import filtered_logger
+
+# Sweep axes of the redaction micro-benchmarks
+FIELD_COUNTS = (1, 5, 25, 100)
+MATCH_COUNTS = (0, 1, 5)
+MESSAGE_LENGTHS = (128, 512, 4096)
+SEPARATORS = (';', ',', '|', '\t')
+
+
+def generate_rows(count: int) -> Iterator[Tuple[str, ...]]:
+    """
+    Generate users rows shaped like user_data.csv.
+
+    Args:
+        count (int): Number of rows to generate.
+
+    Returns:
+        Iterator[Tuple[str, ...]]: Rows in USER_COLUMNS order.
+    """
+    for i in range(count):
+        yield ("Marlene Wood {}".format(i),
+               "user{}@att.net".format(i),
+               "(473) 401-{:04d}".format(i % 10000),
+               "261-72-{:04d}".format(i % 10000),
+               "K5?BMNv{}".format(i),
+               "60ed:c396:2ff:244:bbd0:9208:26f2:{:x}".format(i % 65536),
+               "2019-11-14 06:14:24",
+               "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+               "AppleWebKit/537.36 (KHTML, like Gecko) "
+               "Chrome/74.0.3729.157 Safari/537.36")
+
+
+def sqlite_users(count: int) -> sqlite3.Connection:
+    """
+    Build an in-memory sqlite stand-in for get_db with ``count`` users.
+
+    Args:
+        count (int): Number of rows in the users table.
+
+    Returns:
+        sqlite3.Connection: Connection holding the populated table.
+    """
+    connection = sqlite3.connect(':memory:')
+    connection.execute("CREATE TABLE users ({});".format(
+        ', '.join(filtered_logger.USER_COLUMNS)))
+    connection.executemany(
+        "INSERT INTO users VALUES ({});".format(
+            ', '.join('?' * len(filtered_logger.USER_COLUMNS))),
+        generate_rows(count))
+    return connection
+
+
+def bench_serial(connection: sqlite3.Connection,
+                 batch_size: int) -> float:
+    """Time export_users with a RedactingFormatter writing to memory"""
+    logger = logging.getLogger('user_data.bench')
+    logger.propagate = False
+    handler = logging.StreamHandler(io.StringIO())
+    handler.setFormatter(
+        filtered_logger.RedactingFormatter(filtered_logger.PII_FIELDS))
+    logger.addHandler(handler)
+    try:
+        start = time.perf_counter()
+        filtered_logger.export_users(connection, logger, batch_size)
+        return time.perf_counter() - start
+    finally:
+        logger.removeHandler(handler)
+
+
+def bench_parallel(connection: sqlite3.Connection, batch_size: int,
+                   workers: int) -> float:
+    """Time export_users_parallel writing to memory"""
+    start = time.perf_counter()
+    filtered_logger.export_users_parallel(connection, io.StringIO(),
+                                          workers, batch_size)
+    return time.perf_counter() - start
+
+
+def compare_parallel(rows: int, batch_size: int, workers: int) -> dict:
+    """
+    Compare serial and parallel export throughput over the same table.
+
+    Args:
+        rows (int): Number of users rows.
+        batch_size (int): Rows per fetch and per worker task.
+        workers (int): Worker processes for the parallel path.
+
+    Returns:
+        dict: Elapsed seconds and rows/sec for each path.
+    """
+    connection = sqlite_users(rows)
+    serial = bench_serial(connection, batch_size)
+    parallel = bench_parallel(connection, batch_size, workers)
+    return {
+        'rows': rows,
+        'workers': workers,
+        'serial_seconds': serial,
+        'serial_rows_per_sec': rows / serial,
+        'parallel_seconds': parallel,
+        'parallel_rows_per_sec': rows / parallel,
+        'speedup': serial / parallel,
+    }
+
+
+def build_message(row: Sequence[str], separator: str, length: int) -> str:
+    """
+    Render a row as ``k=v`` pairs padded to about ``length`` characters.
+
+    The user_agent value is stretched, so the number of fields and their
+    positions do not change with the length.
+
+    Args:
+        row (Sequence[str]): Row in USER_COLUMNS order.
+        separator (str): Character separating the pairs.
+        length (int): Target message length.
+
+    Returns:
+        str: The message, ending with ``separator``.
+    """
+    pairs = ['{}={}'.format(column, value).replace(separator, ' ')
+             for column, value in zip(filtered_logger.USER_COLUMNS, row)]
+    message = separator.join(pairs) + separator
+    if len(message) < length:
+        pairs[-1] += 'x' * (length - len(message))
+        message = separator.join(pairs) + separator
+    return message
+
+
+def rule_fields(field_count: int, match_count: int) -> List[str]:
+    """
+    Build a field list of ``field_count`` names, ``match_count`` of which
+    occur in every generated message.
+
+    Args:
+        field_count (int): Total number of configured fields.
+        match_count (int): Number of PII_FIELDS present in messages.
+
+    Returns:
+        List[str]: The field names.
+    """
+    fields = list(filtered_logger.PII_FIELDS[:match_count])
+    fields += ['pii_key_{}'.format(i)
+               for i in range(field_count - match_count)]
+    return fields
+
+
+def measure(func: Callable, inputs: Sequence, iterations: int) -> dict:
+    """
+    Call ``func`` on ``inputs`` in turn and summarize per-call latency.
+
+    Args:
+        func (Callable): Function of one argument to benchmark.
+        inputs (Sequence): Arguments cycled through.
+        iterations (int): Number of timed calls.
+
+    Returns:
+        dict: ops_per_sec, p50_us and p99_us.
+    """
+    timings = []
+    clock = time.perf_counter_ns
+    for arg in itertools.islice(itertools.cycle(inputs), iterations):
+        start = clock()
+        func(arg)
+        timings.append(clock() - start)
+    timings.sort()
+    total = sum(timings)
+    return {
+        'ops_per_sec': iterations * 1e9 / total if total else 0.0,
+        'p50_us': timings[len(timings) // 2] / 1000,
+        'p99_us': timings[min(len(timings) - 1,
+                              len(timings) * 99 // 100)] / 1000,
+    }
+
+
+def sweep(iterations: int = 2000, samples: int = 64) -> Iterator[dict]:
+    """
+    Benchmark filter_datum, the ``scan`` matcher and
+    RedactingFormatter.format across message length, field count, match
+    count and separator.
+
+    RedactingFormatter has a fixed separator, so it is only measured for
+    its own SEPARATOR.
+
+    Args:
+        iterations (int): Timed calls per case.
+        samples (int): Distinct generated rows cycled through per case.
+
+    Returns:
+        Iterator[dict]: One result per case.
+    """
+    rows = list(generate_rows(samples))
+    redaction = filtered_logger.RedactingFormatter.REDACTION
+    for length, field_count, match_count, separator in itertools.product(
+            MESSAGE_LENGTHS, FIELD_COUNTS, MATCH_COUNTS, SEPARATORS):
+        if match_count > field_count:
+            continue
+        fields = rule_fields(field_count, match_count)
+        messages = [build_message(row, separator, length) for row in rows]
+        case = {
+            'length': length,
+            'fields': field_count,
+            'matches': match_count,
+            'separator': separator,
+        }
+        result = measure(
+            lambda message: filtered_logger.filter_datum(
+                fields, redaction, message, separator),
+            messages, iterations)
+        yield dict(case, target='filter_datum', **result)
+        engine = filtered_logger.get_redaction_engine(
+            fields, redaction, separator, 'scan')
+        result = measure(engine.redact, messages, iterations)
+        yield dict(case, target='FieldScanEngine.redact', **result)
+        if separator != filtered_logger.RedactingFormatter.SEPARATOR:
+            continue
+        formatter = filtered_logger.RedactingFormatter(fields)
+        records = [logging.LogRecord('user_data', logging.INFO, None, None,
+                                     message, None, None)
+                   for message in messages]
+        result = measure(formatter.format, records, iterations)
+        yield dict(case, target='RedactingFormatter.format', **result)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('suite', nargs='?', default='sweep',
+                        choices=('sweep', 'parallel'))
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--batch-size', type=int,
+                        default=filtered_logger.EXPORT_BATCH_SIZE)
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+    if args.suite == 'sweep':
+        results = sweep(args.iterations)
+    else:
+        results = [compare_parallel(args.rows, args.batch_size,
+                                    args.workers)]
+    for result in results:
+        json.dump(result, sys.stdout)
+        sys.stdout.write('\n')
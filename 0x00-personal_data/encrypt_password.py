@@ -3,21 +3,89 @@
 Module for encrypting password
 """
 
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, Tuple
 import bcrypt
 
+# bcrypt cost used by hash_password; 12 is bcrypt.gensalt's own default.
+# Set it from calibrate_rounds at start-up to follow the latency budget.
+ROUNDS = int(os.getenv('BCRYPT_ROUNDS', 12))
 
-def hash_password(password: str) -> bytes:
+# Range of cost factors accepted by bcrypt
+MIN_ROUNDS = 4
+MAX_ROUNDS = 31
+
+
+def hash_password(password: str, rounds: int = None) -> bytes:
     """
         Hashes a password with a randomly-generated salt and
         returns the hashed password.
 
         Args:
             password (str): The password to hash.
+            rounds (int): bcrypt cost factor, ROUNDS by default.
 
         Returns:
             bytes: The salted and hashed password.
         """
-    return bcrypt.hashpw(password.encode(), bcrypt.gensalt())
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds or ROUNDS))
+
+
+def calibrate_rounds(target_seconds: float = 0.25,
+                     min_rounds: int = MIN_ROUNDS,
+                     max_rounds: int = MAX_ROUNDS,
+                     samples: int = 3) -> int:
+    """
+        Finds the highest bcrypt cost whose verify time on this machine
+        stays within ``target_seconds``.
+
+        Each extra round doubles the work, so the search measures one cost
+        and steps up while twice the measured time still fits. A cost is
+        timed by the best of up to ``samples`` verifies, so one slow run
+        (scheduling, a cold cache) does not stop the search early.
+
+        Every cost tried also pays for the hash it verifies, and the last
+        one for all its samples: with 3 samples the search takes about
+        three to six times ``target_seconds``.
+
+        Args:
+            target_seconds (float): Verify time budget for one password.
+            min_rounds (int): Lowest cost returned, even if over budget.
+            max_rounds (int): Highest cost considered.
+            samples (int): Verifies timed per cost, at least one.
+
+        Returns:
+            int: The cost factor to use as ROUNDS.
+    """
+    password = b'calibration-password'
+    rounds = min_rounds
+    while rounds < max_rounds:
+        hashed = bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+        for _ in range(max(samples, 1)):
+            start = time.perf_counter()
+            bcrypt.checkpw(password, hashed)
+            if (time.perf_counter() - start) * 2 <= target_seconds:
+                break
+        else:
+            break
+        rounds += 1
+    return rounds
+
+
+def hash_rounds(hashed_password: bytes) -> int:
+    """
+        Reads the cost factor stored in a bcrypt hash.
+
+        Args:
+            hashed_password (bytes): Hash such as ``$2b$12$...``.
+
+        Returns:
+            int: The cost factor it was created with.
+    """
+    return int(hashed_password.split(b'$')[2])
 
 
 def is_valid(hashed_password: bytes, password: str) -> bool:
@@ -33,3 +101,105 @@ def is_valid(hashed_password: bytes, password: str) -> bool:
             False otherwise.
     """
     return bcrypt.checkpw(password.encode(), hashed_password)
+
+
+def needs_rehash(hashed_password: bytes, rounds: int = None) -> bool:
+    """
+        Tells whether a stored hash was made with another cost than the
+        current one.
+
+        Args:
+            hashed_password (bytes): The stored hash.
+            rounds (int): Wanted cost factor, ROUNDS by default.
+
+        Returns:
+            bool: True if the hash should be recomputed.
+    """
+    return hash_rounds(hashed_password) != (rounds or ROUNDS)
+
+
+def check_password(hashed_password: bytes, password: str,
+                   rounds: int = None) -> Tuple[bool, bool]:
+    """
+        Validates a password like is_valid and reports whether the stored
+        hash uses an outdated cost, so a login can rehash it with
+        hash_password while the plain text password is at hand.
+
+        Args:
+            hashed_password (bytes): The hashed password to check against.
+            password (str): The plain text password to validate.
+            rounds (int): Wanted cost factor, ROUNDS by default.
+
+        Returns:
+            Tuple[bool, bool]: Whether the password matches, and whether
+            it matches with an outdated cost.
+    """
+    valid = is_valid(hashed_password, password)
+    return valid, valid and needs_rehash(hashed_password, rounds)
+
+
+def _ordered_map(func: Callable, items: Iterable,
+                 workers: int = None) -> Iterator:
+    """
+        Apply ``func`` to ``items`` on a bounded thread pool, yielding the
+        results in input order.
+
+        bcrypt releases the GIL while hashing, so the threads run on
+        separate cores. At most two items per worker are in flight, so
+        the input is consumed lazily.
+
+        Args:
+            func (Callable): Function of one argument.
+            items (Iterable): Arguments, consumed as results are needed.
+            workers (int): Pool size, the CPU count by default.
+
+        Returns:
+            Iterator: ``func(item)`` for each item, in order.
+    """
+    workers = workers or os.cpu_count() or 1
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        try:
+            for item in items:
+                pending.append(executor.submit(func, item))
+                if len(pending) >= workers * 2:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def hash_passwords(passwords: Iterable[str],
+                   workers: int = None) -> Iterator[bytes]:
+    """
+        Hashes many passwords in parallel, like hash_password.
+
+        Args:
+            passwords (Iterable[str]): The passwords to hash.
+            workers (int): Number of hashing threads, the CPU count by
+            default.
+
+        Returns:
+            Iterator[bytes]: The hashed passwords, in input order.
+    """
+    return _ordered_map(hash_password, passwords, workers)
+
+
+def verify_many(pairs: Iterable[Tuple[bytes, str]],
+                workers: int = None) -> Iterator[bool]:
+    """
+        Validates many (hashed_password, password) pairs in parallel,
+        like is_valid.
+
+        Args:
+            pairs (Iterable[Tuple[bytes, str]]): Hashes and the plain text
+            passwords to check against them.
+            workers (int): Number of hashing threads, the CPU count by
+            default.
+
+        Returns:
+            Iterator[bool]: One result per pair, in input order.
+    """
+    return _ordered_map(lambda pair: is_valid(*pair), pairs, workers)
@@ -4,10 +4,215 @@ Module to obfuscate data using a filtered logger
 """
 import re
 import os
-from typing import List
+import sys
+import atexit
+import queue
+import threading
+from bisect import bisect_left
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
+from functools import lru_cache
+from itertools import accumulate
+from time import perf_counter
+from typing import (AbstractSet, ByteString, Callable, Iterable, Iterator,
+                    List, Mapping, Optional, Sequence, TextIO, Tuple, Union)
 import logging
+from logging.handlers import QueueHandler, QueueListener
 import mysql.connector
 
+# Maximum number of distinct compiled redaction rules kept in memory
+REDACTION_CACHE_SIZE = 128
+
+# Encoding of the log lines handled by filter_datum_bytes
+LOG_ENCODING = 'utf-8'
+
+# Columns of the users table exported by main, in log order
+USER_COLUMNS = ('name', 'email', 'phone', 'ssn', 'password', 'ip',
+                'last_login', 'user_agent')
+
+# Default number of rows pulled per fetchmany round trip
+EXPORT_BATCH_SIZE = 1000
+
+# Default capacity of the record queue used by get_queued_logger
+QUEUE_MAXSIZE = 10000
+
+# Ways a queued logger may react when its queue is full
+OVERFLOW_POLICIES = ('block', 'drop', 'count')
+
+# Default number of idle database connections kept by get_db's pool
+POOL_SIZE = 5
+
+# Default number of connections get_db's pool lets out at once, and the
+# seconds acquire waits for one of them to come back
+POOL_MAX_OPEN = 15
+POOL_TIMEOUT = 30.0
+
+# LogRecord attribute, set through ``extra``, holding a structured payload
+PAYLOAD_ATTRIBUTE = 'redact_payload'
+
+# Upper bounds, in seconds, of the redaction latency histogram buckets
+LATENCY_BUCKETS = (1e-06, 5e-06, 1e-05, 2.5e-05, 5e-05, 0.0001, 0.00025,
+                   0.0005, 0.001, 0.005)
+
+
+class RedactionEngine:
+    """ Compiled redaction rule for one (fields, redaction, separator) set
+    """
+
+    def __init__(self, fields: Tuple[str, ...], redaction: str,
+                 separator: str):
+        """Compile the substitution pattern once.
+
+            Args:
+                fields (Tuple[str, ...]): Fields whose values are redacted.
+                redaction (str): String to replace the field values with.
+                separator (str): Character separating fields in a message.
+        """
+        self.fields = tuple(fields)
+        self.redaction = redaction
+        self.separator = separator
+        self.pattern = re.compile('({})=[^{}]*'.format(
+            '|'.join(map(re.escape, self.fields)), re.escape(separator)))
+        # The field name is re-emitted from the group by a callback:
+        # cheaper than expanding a template, and the redaction is
+        # inserted literally.
+        self.suffix = '=' + redaction
+
+    def _replace(self, match: re.Match) -> str:
+        """Replacement of one ``field=value`` match."""
+        return match.group(1) + self.suffix
+
+    def redact(self, message: str, hits: List[str] = None) -> str:
+        """Replace the value of every configured field in one pass.
+
+            Args:
+                message (str): Log message to be obfuscated.
+                hits (List[str]): When given, the name of each matched
+                    field is appended to it, in the same pass.
+
+            Returns:
+                str: Obfuscated log message.
+        """
+        if not self.fields:
+            return message
+        if hits is None:
+            return self.pattern.sub(self._replace, message)
+
+        def replace(match: re.Match) -> str:
+            field = match.group(1)
+            hits.append(field)
+            return field + self.suffix
+
+        return self.pattern.sub(replace, message)
+
+
+class FieldScanEngine:
+    """ Redaction rule matching ``field=`` keys in one scan of the message
+
+        Every match ends at an ``=``, and field names contain none, so the
+        scan jumps from ``=`` to ``=`` and looks up the longest configured
+        key just before it, trying each distinct key length once. The cost
+        depends on the message and the number of distinct key lengths, not
+        on how many fields are configured, and the output is the same as
+        RedactionEngine's leftmost-match substitution.
+    """
+
+    def __init__(self, fields: Tuple[str, ...], redaction: str,
+                 separator: str):
+        """Index the fields by length.
+
+            Args:
+                fields (Tuple[str, ...]): Fields whose values are redacted.
+                redaction (str): String to replace the field values with.
+                separator (str): Character separating fields in a message.
+
+            Raises:
+                ValueError: If a field contains ``=``.
+        """
+        if any('=' in field for field in fields):
+            raise ValueError("field names must not contain '='")
+        self.fields = tuple(fields)
+        self.redaction = redaction
+        self.separator = separator
+        self.keys = frozenset(self.fields)
+        self.lengths = sorted({len(field) for field in self.fields},
+                              reverse=True)
+        self.value = re.compile('[^{}]*'.format(re.escape(separator)))
+
+    def redact(self, message: str, hits: List[str] = None) -> str:
+        """Replace the value of every configured field in one pass.
+
+            Args:
+                message (str): Log message to be obfuscated.
+                hits (List[str]): When given, the name of each matched
+                    field is appended to it.
+
+            Returns:
+                str: Obfuscated log message.
+        """
+        keys = self.keys
+        parts = []
+        emitted = 0  # end of the text already copied to parts
+        bound = 0  # a key may not start before this offset
+        eq = message.find('=')
+        while eq >= 0:
+            for length in self.lengths:
+                if length <= eq - bound and message[eq - length:eq] in keys:
+                    end = self.value.match(message, eq + 1).end()
+                    parts.append(message[emitted:eq + 1])
+                    parts.append(self.redaction)
+                    emitted = bound = end
+                    if hits is not None:
+                        hits.append(message[eq - length:eq])
+                    break
+            else:
+                bound = eq + 1
+            eq = message.find('=', max(bound, eq + 1))
+        if not parts:
+            return message
+        parts.append(message[emitted:])
+        return ''.join(parts)
+
+
+# Redaction engines selectable by name, see get_redaction_engine
+MATCHERS = {
+    'regex': RedactionEngine,
+    'scan': FieldScanEngine,
+}
+
+
+@lru_cache(maxsize=REDACTION_CACHE_SIZE)
+def _redaction_engine(fields: Tuple[str, ...], redaction: str,
+                      separator: str, matcher: str) -> RedactionEngine:
+    """Build a redaction engine, memoized per distinct rule set"""
+    return MATCHERS[matcher](fields, redaction, separator)
+
+
+def get_redaction_engine(fields: Sequence[str], redaction: str,
+                         separator: str,
+                         matcher: str = 'regex') -> RedactionEngine:
+    """
+    Return the shared, compiled RedactionEngine for a rule set
+
+    Args:
+        fields (Sequence[str]): Fields to obfuscate.
+        redaction (str): String to replace the field values with.
+        separator (str): Character separating fields in the log message.
+        matcher (str): ``regex`` for a single alternation pattern, ``scan``
+            for FieldScanEngine, better suited to long field lists.
+
+    Returns:
+        RedactionEngine: Cached engine for these arguments.
+
+    Raises:
+        ValueError: If the matcher is unknown.
+    """
+    if matcher not in MATCHERS:
+        raise ValueError("matcher must be one of {}".format(
+            ', '.join(MATCHERS)))
+    return _redaction_engine(tuple(fields), redaction, separator, matcher)
+
 
 def filter_datum(fields: List[str], redaction: str, message: str,
                  separator: str) -> str:
@@ -23,10 +228,288 @@ def filter_datum(fields: List[str], redaction: str, message: str,
     Returns:
         str: Obfuscated log message.
     """
-    pattern = '|'.join([f'{field}=[^{separator}]*' for field in fields])
-    return re.sub(pattern,
-                  lambda m: m.group(0).split('=')[0] + '=' + redaction,
-                  message)
+    return get_redaction_engine(fields, redaction, separator).redact(message)
+
+
+class BytesRedactionEngine:
+    """ Compiled redaction rule working on encoded log lines
+    """
+
+    def __init__(self, fields: Tuple[str, ...], redaction: bytes,
+                 separator: bytes):
+        """Compile the bytes substitution pattern once.
+
+            Args:
+                fields (Tuple[str, ...]): Fields whose values are redacted.
+                redaction (bytes): Encoded replacement for field values.
+                separator (bytes): Byte separating fields in a message.
+        """
+        self.fields = tuple(fields)
+        self.redaction = bytes(redaction)
+        self.separator = bytes(separator)
+        self.pattern = re.compile(b'(' + b'|'.join(
+            re.escape(field.encode(LOG_ENCODING)) for field in self.fields
+        ) + b')=([^' + re.escape(self.separator) + b']*)')
+        self.replacement = (br'\g<1>=' +
+                            self.redaction.replace(b'\\', br'\\'))
+
+    def redact(self, message: ByteString) -> ByteString:
+        """Replace the value of every configured field.
+
+            A bytearray is rewritten in place, and returned, when every
+            value is at least as long as the redaction; a writable
+            memoryview is, when every value is exactly as long. Otherwise a
+            new bytes object is returned.
+
+            Args:
+                message (ByteString): Encoded log message.
+
+            Returns:
+                ByteString: Obfuscated log message.
+        """
+        if not self.fields:
+            return message
+        if isinstance(message, bytes):
+            return self.pattern.sub(self.replacement, message)
+        spans = [match.span(2) for match in self.pattern.finditer(message)]
+        size = len(self.redaction)
+        if isinstance(message, bytearray):
+            if all(end - start >= size for start, end in spans):
+                # Walk backwards so earlier spans keep their offsets; when
+                # the lengths are equal this is a plain overwrite.
+                for start, end in reversed(spans):
+                    message[start:end] = self.redaction
+                return message
+        elif not message.readonly and \
+                all(end - start == size for start, end in spans):
+            for start, end in spans:
+                message[start:end] = self.redaction
+            return message
+        parts = []
+        last = 0
+        for start, end in spans:
+            parts.append(message[last:start])
+            parts.append(self.redaction)
+            last = end
+        parts.append(message[last:])
+        return b''.join(parts)
+
+
+@lru_cache(maxsize=REDACTION_CACHE_SIZE)
+def _bytes_redaction_engine(fields: Tuple[str, ...], redaction: bytes,
+                            separator: bytes) -> BytesRedactionEngine:
+    """Build a BytesRedactionEngine, memoized per distinct rule set"""
+    return BytesRedactionEngine(fields, redaction, separator)
+
+
+def filter_datum_bytes(fields: List[str], redaction: Union[str, bytes],
+                       message: ByteString,
+                       separator: Union[str, bytes]) -> ByteString:
+    """
+    Obfuscate an encoded log message, with the semantics of filter_datum
+
+    Args:
+        fields (List[str]): List of fields to obfuscate.
+        redaction (Union[str, bytes]): Replacement for the field values,
+            encoded with LOG_ENCODING when given as str.
+        message (ByteString): bytes, bytearray or memoryview log line.
+        separator (Union[str, bytes]): Single-byte field separator.
+
+    Returns:
+        ByteString: The same bytearray modified in place when the
+        redaction fits, otherwise a new bytes object.
+    """
+    if isinstance(redaction, str):
+        redaction = redaction.encode(LOG_ENCODING)
+    if isinstance(separator, str):
+        separator = separator.encode(LOG_ENCODING)
+    engine = _bytes_redaction_engine(tuple(fields), redaction, separator)
+    return engine.redact(message)
+
+
+def structured_payload(record: logging.LogRecord) -> Optional[Mapping]:
+    """
+    Return the mapping payload of a structured log record, if any.
+
+    Only records with an empty message are structured. Their payload is
+    taken from ``extra={'redact_payload': {...}}`` or from a mapping
+    passed as the only log argument, and its rendering takes the place
+    of the message. A record with a message is formatted as plain text,
+    and a payload attached to it is not logged.
+
+    Args:
+        record (logging.LogRecord): The log record to inspect.
+
+    Returns:
+        Optional[Mapping]: The payload, or None for a plain text record.
+    """
+    if record.msg:
+        return None
+    payload = getattr(record, PAYLOAD_ATTRIBUTE, None)
+    if isinstance(payload, Mapping):
+        return payload
+    if isinstance(record.args, Mapping):
+        return record.args
+    return None
+
+
+def render_payload(payload: Mapping, fields: AbstractSet[str],
+                   redaction: str, hits: List[str] = None) -> str:
+    """
+    Render a payload as the ``k=v; `` message, redacting by key lookup.
+
+    The result matches filter_datum applied to format_row output for the
+    same keys, without parsing the message back.
+
+    Args:
+        payload (Mapping): Field names and values, in message order.
+        fields (AbstractSet[str]): Keys whose values are redacted.
+        redaction (str): String to replace the field values with.
+        hits (List[str]): When given, each redacted key is appended to it.
+
+    Returns:
+        str: The message, e.g. ``name=***; ip=1.2.3.4;``.
+    """
+    if hits is not None:
+        hits.extend(key for key in payload if key in fields)
+    return '{};'.format('; '.join(
+        '{}={}'.format(key, redaction if key in fields else value)
+        for key, value in payload.items()))
+
+
+class Histogram:
+    """ Cumulative latency histogram with fixed upper bounds in seconds
+    """
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        """Initialize an empty histogram.
+
+            Args:
+                buckets (Sequence[float]): Sorted bucket upper bounds.
+        """
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float):
+        """Add one observation; callers hold the owning metrics lock.
+        """
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def to_dict(self) -> dict:
+        """Return cumulative bucket counts, sum and count.
+        """
+        cumulative = list(accumulate(self.counts))
+        bounds = [str(bound) for bound in self.buckets] + ['+Inf']
+        return {
+            'buckets': dict(zip(bounds, cumulative)),
+            'sum': self.sum,
+            'count': self.count,
+        }
+
+
+def _prometheus_label(value: str) -> str:
+    """Escape a label value as the Prometheus text format requires"""
+    return (str(value).replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n'))
+
+
+class RedactionMetrics:
+    """ Counters and latency histograms of RedactingFormatter.format
+    """
+
+    STAGES = ('format', 'redact')
+
+    def __init__(self, enabled: bool = True):
+        """Initialize empty metrics.
+
+            Args:
+                enabled (bool): Whether formatters record anything. When
+                    False, format takes its uninstrumented path.
+        """
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Zero every counter and histogram.
+        """
+        with self._lock:
+            self.records = 0
+            self.field_matches = Counter()
+            self.stages = {stage: Histogram() for stage in self.STAGES}
+
+    def observe(self, format_seconds: float, redact_seconds: Optional[float],
+                hits: List[str]):
+        """Account for one formatted record.
+
+            Args:
+                format_seconds (float): Time spent in Formatter.format.
+                redact_seconds (Optional[float]): Time spent redacting the
+                    formatted message, None for structured records that
+                    are redacted while being formatted.
+                hits (List[str]): Names of the fields redacted.
+        """
+        with self._lock:
+            self.records += 1
+            self.field_matches.update(hits)
+            self.stages['format'].observe(format_seconds)
+            if redact_seconds is not None:
+                self.stages['redact'].observe(redact_seconds)
+
+    def snapshot(self) -> dict:
+        """Return a consistent copy of every metric.
+        """
+        with self._lock:
+            return {
+                'records': self.records,
+                'field_matches': dict(self.field_matches),
+                'stages': {stage: histogram.to_dict()
+                           for stage, histogram in self.stages.items()},
+            }
+
+    def to_prometheus(self) -> str:
+        """Render the metrics in the Prometheus text exposition format.
+
+            Field names come from the caller, so label values are escaped.
+        """
+        snapshot = self.snapshot()
+        lines = [
+            '# HELP redaction_records_total Records formatted by '
+            'RedactingFormatter.',
+            '# TYPE redaction_records_total counter',
+            'redaction_records_total {}'.format(snapshot['records']),
+            '# HELP redaction_field_matches_total Values redacted per field.',
+            '# TYPE redaction_field_matches_total counter',
+        ]
+        for field, count in sorted(snapshot['field_matches'].items()):
+            lines.append('redaction_field_matches_total{{field="{}"}} {}'
+                         .format(_prometheus_label(field), count))
+        lines += [
+            '# HELP redaction_stage_seconds Time spent per formatting stage.',
+            '# TYPE redaction_stage_seconds histogram',
+        ]
+        for stage, histogram in snapshot['stages'].items():
+            stage = _prometheus_label(stage)
+            for bound, count in histogram['buckets'].items():
+                lines.append(
+                    'redaction_stage_seconds_bucket{{stage="{}",le="{}"}} {}'
+                    .format(stage, bound, count))
+            lines.append('redaction_stage_seconds_sum{{stage="{}"}} {}'
+                         .format(stage, histogram['sum']))
+            lines.append('redaction_stage_seconds_count{{stage="{}"}} {}'
+                         .format(stage, histogram['count']))
+        return '\n'.join(lines) + '\n'
+
+
+# Process-wide redaction metrics, off by default as they add timers and
+# a locked update to every record; set METRICS.enabled to True (or
+# PERSONAL_DATA_REDACTION_METRICS=1) to turn instrumentation on
+METRICS = RedactionMetrics(
+    os.getenv('PERSONAL_DATA_REDACTION_METRICS', '0') != '0')
 
 
 class RedactingFormatter(logging.Formatter):
@@ -37,65 +520,291 @@ class RedactingFormatter(logging.Formatter):
     FORMAT = "[HOLBERTON] %(name)s %(levelname)s %(asctime)-15s: %(message)s"
     SEPARATOR = ";"
 
-    def __init__(self, fields: List[str]):
+    def __init__(self, fields: List[str], matcher: str = 'regex'):
         """Initialize the formatter with the list of fields to obfuscate.
 
             Args:
                 fields (List[str]): List of fields to obfuscate.
+                matcher (str): Redaction engine, ``regex`` or ``scan``;
+                    see get_redaction_engine.
         """
         super().__init__(self.FORMAT)
         self.fields = fields
+        self.engine = get_redaction_engine(fields, self.REDACTION,
+                                           self.SEPARATOR, matcher)
+        self.field_set = frozenset(fields)
 
     def format(self, record: logging.LogRecord) -> str:
         """Format the log record by obfuscating specified fields.
 
+            Records carrying a mapping payload (see structured_payload)
+            are redacted by key before rendering, skipping the regex pass
+            unless the record also has exception or stack text.
+
             Args:
                 record (logging.LogRecord): The log record to format.
 
             Returns:
                 str: The formatted log record with obfuscated fields.
         """
-        message = super().format(record)
-        return filter_datum(self.fields, self.REDACTION, message,
-                            self.SEPARATOR)
+        payload = structured_payload(record)
+        if not METRICS.enabled:
+            if payload is None:
+                message = super().format(record)
+                return self.engine.redact(message)
+            return self._format_payload(record, payload)
+        hits = []
+        if payload is None:
+            start = perf_counter()
+            message = super().format(record)
+            formatted = perf_counter()
+            message = self.engine.redact(message, hits)
+            METRICS.observe(formatted - start, perf_counter() - formatted,
+                            hits)
+            return message
+        start = perf_counter()
+        message = self._format_payload(record, payload, hits)
+        METRICS.observe(perf_counter() - start, None, hits)
+        return message
+
+    def _format_payload(self, record: logging.LogRecord, payload: Mapping,
+                        hits: List[str] = None) -> str:
+        """Format a structured record, redacting its payload by key"""
+        msg, args = record.msg, record.args
+        record.msg = render_payload(payload, self.field_set, self.REDACTION,
+                                    hits)
+        record.args = None
+        try:
+            message = super().format(record)
+        finally:
+            record.msg, record.args = msg, args
+        if record.exc_text or record.stack_info:
+            message = self.engine.redact(message, hits)
+        return message
 
 
 # Define PII_FIELDS with a tuple of fields considered as PII
 PII_FIELDS = ('name', 'email', 'phone', 'ssn', 'password')
 
 
-def get_logger() -> logging.Logger:
+@lru_cache(maxsize=REDACTION_CACHE_SIZE)
+def _formatter(fields: Tuple[str, ...], matcher: str) -> RedactingFormatter:
+    """Build a RedactingFormatter, memoized per field set and matcher"""
+    return RedactingFormatter(fields=fields, matcher=matcher)
+
+
+def get_formatter(fields: Sequence[str] = PII_FIELDS,
+                  matcher: str = 'regex') -> RedactingFormatter:
+    """
+    Return the RedactingFormatter shared by every handler using ``fields``.
+
+    Args:
+        fields (Sequence[str]): Fields to obfuscate.
+        matcher (str): Redaction engine, ``regex`` or ``scan``.
+
+    Returns:
+        RedactingFormatter: Cached formatter instance.
+    """
+    return _formatter(tuple(fields), matcher)
+
+
+# Loggers configured by this module: name -> (configuration, logger)
+_loggers = {}
+_loggers_lock = threading.Lock()
+
+
+def _cached_logger(name: str, config: tuple,
+                   configure: Callable[[logging.Logger], None]
+                   ) -> logging.Logger:
+    """
+    Return the logger registered under ``name``, configuring it once.
+
+    Args:
+        name (str): Logger name.
+        config (tuple): Hashable description of the wanted set-up.
+        configure (Callable): Attaches handlers to a new logger.
+
+    Returns:
+        logging.Logger: Configured logger instance.
+
+    Raises:
+        ValueError: If ``name`` was already configured differently.
+    """
+    with _loggers_lock:
+        entry = _loggers.get(name)
+        if entry is not None:
+            if entry[0] != config:
+                raise ValueError("logger {!r} is already configured with {}"
+                                 .format(name, entry[0]))
+            return entry[1]
+        logger = logging.getLogger(name)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False  # Disable propagation
+        configure(logger)
+        _loggers[name] = (config, logger)
+        return logger
+
+
+def get_logger(name: str = 'user_data',
+               fields: Sequence[str] = PII_FIELDS) -> logging.Logger:
     """
     Create a logger with the name 'user_data' and
     configure it with a RedactingFormatter.
 
+    Handlers are attached on the first call only; later calls with the
+    same name and fields return the same logger.
+
+    Args:
+        name (str): Logger name.
+        fields (Sequence[str]): Fields to obfuscate.
+
     Returns:
         logging.Logger: Configured logger instance.
+
+    Raises:
+        ValueError: If ``name`` was already configured differently.
     """
-    logger = logging.getLogger('user_data')
-    logger.setLevel(logging.INFO)
-    logger.propagate = False  # Disable propagation
+    fields = tuple(fields)
+
+    def configure(logger: logging.Logger):
+        """Attach a StreamHandler with the shared formatter"""
+        handler = logging.StreamHandler()
+        handler.setFormatter(get_formatter(fields))
+        logger.addHandler(handler)
+
+    return _cached_logger(name, ('stream', fields), configure)
+
+
+class OverflowQueueHandler(QueueHandler):
+    """ QueueHandler that only enqueues and applies an overflow policy
+        """
 
-    # Create a StreamHandler
-    handler = logging.StreamHandler()
-    # Set the formatter to RedactingFormatter with PII_FIELDS
-    formatter = RedactingFormatter(fields=PII_FIELDS)
-    handler.setFormatter(formatter)
+    def __init__(self, record_queue: queue.Queue,
+                 overflow: str = "block"):
+        """Initialize the handler.
 
-    # Add the handler to the logger
-    logger.addHandler(handler)
+            Args:
+                record_queue (queue.Queue): Bounded queue of pending records.
+                overflow (str): What to do when the queue is full:
+                    ``block`` waits for room, ``drop`` discards the record,
+                    ``count`` discards it and increments ``dropped``.
+        """
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError("overflow must be one of {}".format(
+                ', '.join(OVERFLOW_POLICIES)))
+        super().__init__(record_queue)
+        self.overflow = overflow
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """Hand the record over untouched.
 
-    return logger
+            The listener thread formats and redacts it, so the caller does
+            no string work at all.
+        """
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        """Put the record on the queue according to the overflow policy.
+        """
+        if self.overflow == "block":
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            if self.overflow == "count":
+                with self.lock:
+                    self.dropped += 1
 
 
-def get_db() -> mysql.connector.connection.MySQLConnection:
+class RedactingQueueListener(QueueListener):
+    """ QueueListener that drains cleanly on a bounded queue
+        """
+
+    def enqueue_sentinel(self):
+        """Block until the stop sentinel fits, so pending records flush.
+        """
+        self.queue.put(self._sentinel)
+
+    def stop(self):
+        """Flush pending records and join the listener thread once.
+        """
+        if self._thread is None:
+            return
+        super().stop()
+
+
+def get_queued_logger(maxsize: int = QUEUE_MAXSIZE,
+                      overflow: str = "block",
+                      name: str = 'user_data',
+                      fields: Sequence[str] = PII_FIELDS) -> logging.Logger:
     """
-     Connect to a secure MySQL database using credentials
-     from environment variables.
+    Create the 'user_data' logger in queued mode.
+
+    Callers only enqueue records; a background listener thread formats
+    them with a RedactingFormatter and writes them to a StreamHandler.
+    The listener is flushed and stopped at interpreter exit, or earlier
+    through stop_queued_logger. Like get_logger, it is set up only once.
+
+    Args:
+        maxsize (int): Capacity of the record queue.
+        overflow (str): ``block``, ``drop`` or ``count``.
+        name (str): Logger name.
+        fields (Sequence[str]): Fields to obfuscate.
 
     Returns:
-        mysql.connector.connection.MySQLConnection:
-        Connection to the MySQL database.
+        logging.Logger: Configured logger instance.
+
+    Raises:
+        ValueError: If ``name`` was already configured differently.
+    """
+    fields = tuple(fields)
+
+    def configure(logger: logging.Logger):
+        """Attach a queue handler drained by a listener thread"""
+        stream_handler = logging.StreamHandler()
+        stream_handler.setFormatter(get_formatter(fields))
+
+        record_queue = queue.Queue(maxsize)
+        handler = OverflowQueueHandler(record_queue, overflow)
+        handler.listener = RedactingQueueListener(record_queue,
+                                                  stream_handler)
+        handler.listener.start()
+        atexit.register(handler.listener.stop)
+
+        logger.addHandler(handler)
+
+    return _cached_logger(name, ('queued', fields, maxsize, overflow),
+                          configure)
+
+
+def stop_queued_logger(logger: logging.Logger):
+    """
+    Flush and stop every queue listener attached to ``logger``.
+
+    The logger is dropped from the registry, so a later get_logger or
+    get_queued_logger call configures it afresh.
+
+    Args:
+        logger (logging.Logger): Logger returned by get_queued_logger.
+    """
+    with _loggers_lock:
+        _loggers.pop(logger.name, None)
+    for handler in list(logger.handlers):
+        listener = getattr(handler, 'listener', None)
+        if listener is not None:
+            listener.stop()
+            logger.removeHandler(handler)
+
+
+@lru_cache(maxsize=None)
+def db_config() -> dict:
+    """
+    Read the database credentials from environment variables, once.
+
+    Returns:
+        dict: Keyword arguments for mysql.connector.connect.
 
     Raises:
         ValueError: If critical environment variables are not set.
@@ -109,42 +818,496 @@ def get_db() -> mysql.connector.connection.MySQLConnection:
     if not db_name:
         raise ValueError("Database name is not set in environment variables.")
 
-    return mysql.connector.connect(
-        user=db_username,
-        password=db_password,
-        host=db_host,
-        database=db_name
-    )
+    return {
+        'user': db_username,
+        'password': db_password,
+        'host': db_host,
+        'database': db_name,
+    }
+
+
+def connect_mysql() -> mysql.connector.connection.MySQLConnection:
+    """
+     Connect to a secure MySQL database using credentials
+     from environment variables.
+
+    Returns:
+        mysql.connector.connection.MySQLConnection:
+        Connection to the MySQL database.
+    """
+    return mysql.connector.connect(**db_config())
+
+
+class PooledConnection:
+    """ Connection proxy that goes back to its pool when closed
+    """
+
+    def __init__(self, pool: 'ConnectionPool', connection):
+        """Wrap ``connection`` borrowed from ``pool``.
+        """
+        self._pool = pool
+        self._connection = connection
+
+    def __getattr__(self, name: str):
+        """Delegate everything else to the underlying connection.
+        """
+        if self._connection is None:
+            raise ValueError("connection returned to the pool")
+        return getattr(self._connection, name)
+
+    def close(self):
+        """Hand the connection back to the pool instead of closing it.
+        """
+        if self._connection is not None:
+            self._pool.release(self._connection)
+            self._connection = None
+
+    def __enter__(self) -> 'PooledConnection':
+        """Use the proxy as a context manager; special methods are looked
+        up on the class, so __getattr__ cannot forward them.
+        """
+        return self
+
+    def __exit__(self, *exc_info) -> bool:
+        """Release the connection to the pool on leaving the block.
+        """
+        self.close()
+        return False
+
+
+class ConnectionPool:
+    """ Pool of reusable DB-API connections with a pluggable backend
+    """
+
+    def __init__(self, connect: Callable = connect_mysql,
+                 size: int = POOL_SIZE, max_open: int = POOL_MAX_OPEN,
+                 timeout: float = POOL_TIMEOUT):
+        """Initialize an empty pool.
+
+            Args:
+                connect (Callable): Zero-argument factory opening a new
+                    connection, MySQL by default; tests may pass a sqlite3
+                    stand-in.
+                size (int): Maximum number of idle connections kept.
+                max_open (int): Maximum number of connections borrowed at
+                    once, None for no limit. New connections are only
+                    opened when none is idle, so this also bounds the
+                    connections open to the server.
+                timeout (float): Seconds acquire waits for a borrowed
+                    connection to come back, None to wait forever.
+        """
+        if size < 0:
+            raise ValueError("size must not be negative")
+        if max_open is not None and max_open < 1:
+            raise ValueError("max_open must be at least 1")
+        self.connect = connect
+        self.size = size
+        self.max_open = max_open
+        self.timeout = timeout
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self._slots = (None if max_open is None
+                       else threading.BoundedSemaphore(max_open))
+
+    @staticmethod
+    def is_healthy(connection) -> bool:
+        """Check that an idle connection can still serve queries.
+
+            Args:
+                connection: Connection taken from the idle set.
+
+            Returns:
+                bool: True if the connection answered.
+        """
+        try:
+            if hasattr(connection, 'is_connected'):
+                return connection.is_connected()
+            with closing(connection.cursor()) as cursor:
+                cursor.execute("SELECT 1")
+                cursor.fetchall()
+            return True
+        except Exception:
+            return False
+
+    def acquire(self) -> PooledConnection:
+        """Borrow a healthy idle connection, or open a new one.
+
+            Waits while ``max_open`` connections are borrowed; a proxy
+            dropped without ``close`` keeps its slot.
+
+            Returns:
+                PooledConnection: Proxy whose ``close`` releases it.
+
+            Raises:
+                TimeoutError: If no connection came back within
+                    ``timeout`` seconds.
+        """
+        if self._slots is not None and \
+                not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError("all {} connections are in use".format(
+                self.max_open))
+        try:
+            while True:
+                with self._lock:
+                    connection = self._idle.pop() if self._idle else None
+                if connection is None:
+                    return PooledConnection(self, self.connect())
+                if self.is_healthy(connection):
+                    return PooledConnection(self, connection)
+                _close_quietly(connection)
+        except BaseException:
+            self._free_slot()
+            raise
+
+    def release(self, connection):
+        """Keep ``connection`` for reuse, or close it if the pool is full.
+
+            Args:
+                connection: Connection previously handed out by acquire.
+        """
+        try:
+            try:
+                connection.rollback()
+            except Exception:
+                _close_quietly(connection)
+                return
+            with self._lock:
+                if len(self._idle) < self.size:
+                    self._idle.append(connection)
+                    return
+            _close_quietly(connection)
+        finally:
+            self._free_slot()
+
+    def _free_slot(self):
+        """Let another caller borrow a connection"""
+        if self._slots is not None:
+            self._slots.release()
+
+    def close(self):
+        """Close every idle connection.
+        """
+        with self._lock:
+            idle, self._idle = self._idle, deque()
+        for connection in idle:
+            _close_quietly(connection)
+
+
+def _close_quietly(connection):
+    """Close a connection, ignoring errors from a dead link"""
+    try:
+        connection.close()
+    except Exception:
+        pass
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def configure_pool(connect: Callable = connect_mysql,
+                   size: int = None, max_open: int = None,
+                   timeout: float = POOL_TIMEOUT) -> ConnectionPool:
+    """
+    Replace the pool used by get_db, closing the previous one.
+
+    Args:
+        connect (Callable): Factory opening a new connection.
+        size (int): Maximum number of idle connections, read from
+            PERSONAL_DATA_DB_POOL_SIZE by default.
+        max_open (int): Maximum number of borrowed connections, read
+            from PERSONAL_DATA_DB_POOL_MAX_OPEN by default.
+        timeout (float): Seconds get_db waits for a free connection.
+
+    Returns:
+        ConnectionPool: The new pool.
+    """
+    global _pool
+    if size is None:
+        size = _pool_size()
+    if max_open is None:
+        max_open = _pool_max_open()
+    pool = ConnectionPool(connect, size, max_open, timeout)
+    with _pool_lock:
+        previous, _pool = _pool, pool
+    if previous is not None:
+        previous.close()
+    return pool
+
+
+def _pool_size() -> int:
+    """Read the idle pool size from PERSONAL_DATA_DB_POOL_SIZE"""
+    return int(os.getenv('PERSONAL_DATA_DB_POOL_SIZE', POOL_SIZE))
+
+
+def _pool_max_open() -> int:
+    """Read the borrowed connection limit from
+    PERSONAL_DATA_DB_POOL_MAX_OPEN"""
+    return int(os.getenv('PERSONAL_DATA_DB_POOL_MAX_OPEN', POOL_MAX_OPEN))
+
+
+def get_db() -> PooledConnection:
+    """
+     Get a connection to the MySQL database from the shared pool.
+
+     Idle connections are health checked and reused, so repeated callers
+     do not pay connect/auth latency; ``close()``, or leaving a ``with``
+     block, returns the connection to the pool. At most
+     PERSONAL_DATA_DB_POOL_MAX_OPEN connections are out at once; past
+     that, callers wait up to POOL_TIMEOUT seconds.
+
+     Callers get a PooledConnection proxy, not a MySQLConnection: it
+     forwards attribute access to the connection, but ``isinstance``
+     checks against MySQLConnection fail.
+
+    Returns:
+        PooledConnection: Proxy for a
+        mysql.connector.connection.MySQLConnection.
+
+    Raises:
+        ValueError: If critical environment variables are not set.
+        TimeoutError: If every connection stayed borrowed.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(connect_mysql, _pool_size(),
+                                   _pool_max_open())
+        pool = _pool
+    return pool.acquire()
+
+
+def open_cursor(connection):
+    """
+    Open an unbuffered cursor so rows are pulled from the server on demand.
+
+    mysql.connector accepts ``buffered=False``; DB-API stand-ins such as
+    sqlite3 take no arguments and are already lazy.
+
+    Args:
+        connection: Open DB-API connection.
+
+    Returns:
+        A cursor wrapped so it is closed when leaving a ``with`` block.
+    """
+    try:
+        cursor = connection.cursor(buffered=False)
+    except TypeError:
+        cursor = connection.cursor()
+    return closing(cursor)
+
+
+def iter_batches(cursor,
+                 batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[list]:
+    """
+    Yield the rows of an executed query in ``fetchmany`` batches.
+
+    Args:
+        cursor: Cursor on which a query has been executed.
+        batch_size (int): Number of rows per ``fetchmany`` call.
+
+    Returns:
+        Iterator[list]: Non-empty lists of at most ``batch_size`` rows.
+    """
+    if batch_size <= 0:
+        raise ValueError("batch_size must be a positive integer")
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield rows
+
+
+def iter_rows(cursor, batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[tuple]:
+    """
+    Yield the rows of an executed query, fetching ``batch_size`` at a time.
+
+    Args:
+        cursor: Cursor on which a query has been executed.
+        batch_size (int): Number of rows per ``fetchmany`` call.
+
+    Returns:
+        Iterator[tuple]: The result rows, one at a time.
+    """
+    for rows in iter_batches(cursor, batch_size):
+        yield from rows
+
+
+def format_row(columns: Sequence[str], row: Sequence) -> str:
+    """
+    Render a users row as the ``k=v; `` message logged by main.
+
+    Args:
+        columns (Sequence[str]): Column names, in row order.
+        row (Sequence): Column values.
+
+    Returns:
+        str: The message, e.g. ``name=Bob; email=bob@dylan.com;``.
+    """
+    return '{};'.format('; '.join(
+        '{}={}'.format(column, value) for column, value in zip(columns, row)))
+
+
+def iter_log_records(rows: Iterable[Sequence],
+                     columns: Sequence[str] = USER_COLUMNS,
+                     name: str = "user_data",
+                     structured: bool = False
+                     ) -> Iterator[logging.LogRecord]:
+    """
+    Turn rows into INFO log records ready to be handled by a logger.
+
+    Args:
+        rows (Iterable[Sequence]): Rows of the users table.
+        columns (Sequence[str]): Column names, in row order.
+        name (str): Name of the logger the records belong to.
+        structured (bool): Attach each row as a ``redact_payload`` mapping
+            instead of a pre-rendered ``k=v;`` message, so a
+            RedactingFormatter redacts it by key.
+
+    Returns:
+        Iterator[logging.LogRecord]: One record per row.
+    """
+    for row in rows:
+        if structured:
+            log_record = logging.LogRecord(name, logging.INFO, None, None,
+                                           '', None, None)
+            setattr(log_record, PAYLOAD_ATTRIBUTE, dict(zip(columns, row)))
+            yield log_record
+        else:
+            msg = format_row(columns, row)
+            yield logging.LogRecord(name, logging.INFO, None, None, msg,
+                                    None, None)
 
 
-def main():
+def export_users(connection, logger: logging.Logger,
+                 batch_size: int = EXPORT_BATCH_SIZE,
+                 structured: bool = False) -> int:
+    """
+    Stream every row of the users table through ``logger``.
+
+    Rows flow row -> message -> redacted record one batch at a time, so
+    memory stays flat whatever the size of the table.
+
+    Args:
+        connection: Open DB-API connection (MySQL, or sqlite3 in tests).
+        logger (logging.Logger): Logger whose handlers redact and write.
+        batch_size (int): Number of rows fetched per round trip.
+        structured (bool): Log rows as mapping payloads, redacted by key.
+
+    Returns:
+        int: Number of rows logged.
+    """
+    query = "SELECT {} FROM users;".format(','.join(USER_COLUMNS))
+    count = 0
+    with open_cursor(connection) as cursor:
+        cursor.execute(query)
+        rows = iter_rows(cursor, batch_size)
+        for log_record in iter_log_records(rows, USER_COLUMNS, logger.name,
+                                           structured):
+            logger.handle(log_record)
+            count += 1
+    return count
+
+
+def redact_rows(rows: Sequence[Sequence],
+                fields: Sequence[str] = PII_FIELDS,
+                name: str = "user_data") -> List[str]:
+    """
+    Format and redact a chunk of users rows into log lines.
+
+    Runs inside ProcessPoolExecutor workers, so it only takes and returns
+    picklable values.
+
+    Args:
+        rows (Sequence[Sequence]): Rows of the users table.
+        fields (Sequence[str]): Fields to obfuscate.
+        name (str): Logger name shown in each line.
+
+    Returns:
+        List[str]: One redacted line per row, in row order.
+    """
+    formatter = get_formatter(fields)
+    return [formatter.format(record)
+            for record in iter_log_records(rows, USER_COLUMNS, name)]
+
+
+def export_users_parallel(connection, stream: TextIO = None,
+                          workers: int = None,
+                          batch_size: int = EXPORT_BATCH_SIZE,
+                          fields: Sequence[str] = PII_FIELDS) -> int:
+    """
+    Export the users table with redaction spread over several processes.
+
+    Each ``fetchmany`` batch is redacted by a worker process. At most two
+    batches per worker are in flight, and results are written in the order
+    the rows were read.
+
+    Args:
+        connection: Open DB-API connection (MySQL, or sqlite3 in tests).
+        stream (TextIO): Where lines are written, stderr by default like
+            the StreamHandler used by get_logger.
+        workers (int): Number of worker processes, CPU count by default.
+        batch_size (int): Number of rows per fetch and per worker task.
+        fields (Sequence[str]): Fields to obfuscate.
+
+    Returns:
+        int: Number of rows written.
+    """
+    if stream is None:
+        stream = sys.stderr
+    query = "SELECT {} FROM users;".format(','.join(USER_COLUMNS))
+    fields = tuple(fields)
+    workers = workers or os.cpu_count() or 1
+    max_pending = workers * 2
+    count = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor, \
+            open_cursor(connection) as cursor:
+        pending = deque()
+        cursor.execute(query)
+        for rows in iter_batches(cursor, batch_size):
+            pending.append(executor.submit(redact_rows, rows, fields))
+            if len(pending) >= max_pending:
+                count += _write_lines(stream, pending.popleft().result())
+        while pending:
+            count += _write_lines(stream, pending.popleft().result())
+    stream.flush()
+    return count
+
+
+def _write_lines(stream: TextIO, lines: List[str]) -> int:
+    """Write redacted lines to ``stream`` and return how many were written"""
+    for line in lines:
+        stream.write(line + '\n')
+    return len(lines)
+
+
+def main(batch_size: int = EXPORT_BATCH_SIZE, workers: int = 0,
+         structured: bool = False):
     """
     Logs the information about user records in a table.
 
     This function does the following:
-    1. Defines the fields to retrieve from the users table.
-    2. Connects to the database using the get_db function.
-    3. Retrieves all rows from the users table.
-    4. Logs each row using a logger configured with the RedactingFormatter
+    1. Connects to the database using the get_db function.
+    2. Streams the rows of the users table in batches of ``batch_size``.
+    3. Logs each row using a logger configured with the RedactingFormatter
        to obfuscate PII fields.
+
+    Args:
+        batch_size (int): Number of rows fetched per round trip.
+        workers (int): When positive, redact in that many worker processes
+            with export_users_parallel instead of on the calling thread.
+        structured (bool): On the serial path, log rows as mapping
+            payloads redacted by key instead of by regex.
     """
-    fields = "name,email,phone,ssn,password,ip,last_login,user_agent"
-    columns = fields.split(',')
-    query = "SELECT {} FROM users;".format(fields)
-    info_logger = get_logger()
     connection = get_db()
-    with connection.cursor() as cursor:
-        cursor.execute(query)
-        rows = cursor.fetchall()
-        for row in rows:
-            record = map(
-                lambda x: '{}={}'.format(x[0], x[1]),
-                zip(columns, row),
-            )
-            msg = '{};'.format('; '.join(list(record)))
-            args = ("user_data", logging.INFO, None, None, msg, None, None)
-            log_record = logging.LogRecord(*args)
-            info_logger.handle(log_record)
+    try:
+        if workers > 0:
+            export_users_parallel(connection, workers=workers,
+                                  batch_size=batch_size)
+        else:
+            export_users(connection, get_logger(), batch_size, structured)
+    finally:
+        connection.close()
 
 
 if __name__ == "__main__":
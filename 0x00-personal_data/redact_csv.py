@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Command line tool redacting the PII columns of user_data.csv-style exports
+"""
+import argparse
+import csv
+import io
+import mmap
+import sys
+from typing import Iterator, Sequence, TextIO
+from filtered_logger import PII_FIELDS, RedactingFormatter
+
+# Bytes of the input file decoded per step
+CHUNK_SIZE = 1 << 20
+
+
+def iter_mmap_lines(file_path: str,
+                    chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    """
+    Yield the lines of a file read through mmap, one chunk at a time.
+
+    Chunks are cut after their last newline, so a UTF-8 sequence is never
+    split and only one chunk is decoded at any time. Lines end as with
+    ``open(file_path, newline='')``: other separators such as ``\u2028``
+    stay inside the line.
+
+    Args:
+        file_path (str): Path of the file to read.
+        chunk_size (int): Approximate number of bytes per chunk.
+
+    Returns:
+        Iterator[str]: Lines, line endings included.
+    """
+    with open(file_path, 'rb') as f:
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return  # empty file
+        with mapped:
+            size = len(mapped)
+            start = 0
+            while start < size:
+                end = min(start + chunk_size, size)
+                if end < size:
+                    newline = mapped.rfind(b'\n', start, end)
+                    if newline < 0:
+                        newline = mapped.find(b'\n', end)
+                    end = size if newline < 0 else newline + 1
+                yield from io.StringIO(mapped[start:end].decode('utf-8'),
+                                       newline='')
+                start = end
+
+
+def redact_csv(file_path: str, out: TextIO,
+               fields: Sequence[str] = PII_FIELDS,
+               redaction: str = RedactingFormatter.REDACTION,
+               chunk_size: int = CHUNK_SIZE) -> int:
+    """
+    Stream a CSV file to ``out`` with the values of PII columns redacted.
+
+    Columns are matched by name against the header row and replaced by
+    index, so the other columns are copied as parsed.
+
+    Args:
+        file_path (str): CSV file whose first row is the header.
+        out (TextIO): Destination, opened with ``newline=''``.
+        fields (Sequence[str]): Column names to redact.
+        redaction (str): String replacing the redacted values.
+        chunk_size (int): Number of bytes read from the file per step.
+
+    Returns:
+        int: Number of data rows written.
+    """
+    reader = csv.reader(iter_mmap_lines(file_path, chunk_size))
+    writer = csv.writer(out, lineterminator='\n')
+    header = next(reader, None)
+    if header is None:
+        return 0
+    writer.writerow(header)
+    indexes = [i for i, column in enumerate(header) if column in fields]
+    count = 0
+    for row in reader:
+        for i in indexes:
+            if i < len(row):
+                row[i] = redaction
+        writer.writerow(row)
+        count += 1
+    return count
+
+
+def main(argv: Sequence[str] = None) -> int:
+    """
+    Parse command line arguments and redact the given CSV file.
+
+    Args:
+        argv (Sequence[str]): Arguments, sys.argv[1:] by default.
+
+    Returns:
+        int: Process exit status.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('file', help="CSV file with a header row")
+    parser.add_argument('-o', '--output',
+                        help="destination file, stdout by default")
+    parser.add_argument('-f', '--fields', default=','.join(PII_FIELDS),
+                        help="comma separated columns to redact")
+    parser.add_argument('-r', '--redaction',
+                        default=RedactingFormatter.REDACTION)
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    args = parser.parse_args(argv)
+    fields = tuple(field.strip() for field in args.fields.split(','))
+    if args.output is None:
+        redact_csv(args.file, sys.stdout, fields, args.redaction,
+                   args.chunk_size)
+    else:
+        with open(args.output, 'w', newline='') as out:
+            redact_csv(args.file, out, fields, args.redaction,
+                       args.chunk_size)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Parity tests of filter_datum_bytes against filter_datum
+"""
+import unittest
+from filtered_logger import LOG_ENCODING, filter_datum, filter_datum_bytes
+
+FIELDS = ['name', 'email', 'password']
+SEPARATOR = ';'
+
+
+class TestFilterDatumBytes(unittest.TestCase):
+    """ filter_datum_bytes gives the encoded result of filter_datum
+    """
+
+    MESSAGES = [
+        # values shorter than, equal to and longer than the redaction
+        "name=ab;email=xyz;password=longer_secret;ip=1.2.3.4;",
+        "name=abc;email=xyz;password=def;",
+        "name=bobby;email=bob@dylan.com;password=hunter22;",
+        # non-ASCII values and surrounding text
+        "name=Zoë;email=éà@ü.fr;note=naïve;password=pässwörd;",
+        # empty values, no match, repeated fields
+        "name=;email=;",
+        "ip=1.2.3.4;date=2019-11-19;",
+        "name=a1;name=b22;email=c333;",
+        "",
+    ]
+    REDACTIONS = ["xxx", "***", "a\\b", "\\g<1>", "ø"]
+
+    def check(self, fields, redaction, message):
+        """ Compare every buffer type against the str result
+        """
+        expected = filter_datum(fields, redaction, message, SEPARATOR)
+        expected = expected.encode(LOG_ENCODING)
+        data = message.encode(LOG_ENCODING)
+        with self.subTest(fields=fields, redaction=redaction,
+                          message=message):
+            self.assertEqual(bytes(filter_datum_bytes(
+                fields, redaction, data, SEPARATOR)), expected)
+            self.assertEqual(bytes(filter_datum_bytes(
+                fields, redaction.encode(LOG_ENCODING), data,
+                SEPARATOR.encode(LOG_ENCODING))), expected)
+
+            buffer = bytearray(data)
+            result = filter_datum_bytes(fields, redaction, buffer,
+                                        SEPARATOR)
+            self.assertEqual(bytes(result), expected)
+            if self.all_values_fit(fields, redaction, message):
+                self.assertIs(result, buffer)
+                self.assertEqual(bytes(buffer), expected)
+            else:
+                self.assertIsNot(result, buffer)
+                self.assertEqual(bytes(buffer), data)
+
+            buffer = bytearray(data)
+            view = memoryview(buffer)
+            result = filter_datum_bytes(fields, redaction, view, SEPARATOR)
+            self.assertEqual(bytes(result), expected)
+            if self.all_values_equal(fields, redaction, message):
+                self.assertIs(result, view)
+                self.assertEqual(bytes(buffer), expected)
+            else:
+                self.assertIsNot(result, view)
+                self.assertEqual(bytes(buffer), data)
+
+            view = memoryview(data)
+            result = filter_datum_bytes(fields, redaction, view, SEPARATOR)
+            self.assertEqual(bytes(result), expected)
+            self.assertEqual(view.tobytes(), data)
+
+    @staticmethod
+    def values(fields, message):
+        """ Encoded values of the redacted fields of a message
+        """
+        for part in message.split(SEPARATOR):
+            key, sep, value = part.partition('=')
+            if sep and key in fields:
+                yield value.encode(LOG_ENCODING)
+
+    def all_values_fit(self, fields, redaction, message):
+        """ Whether no value is shorter than the redaction
+        """
+        size = len(redaction.encode(LOG_ENCODING))
+        return all(len(value) >= size
+                   for value in self.values(fields, message))
+
+    def all_values_equal(self, fields, redaction, message):
+        """ Whether every value is as long as the redaction
+        """
+        size = len(redaction.encode(LOG_ENCODING))
+        return all(len(value) == size
+                   for value in self.values(fields, message))
+
+    def test_parity(self):
+        """ Same output for every message, redaction and buffer type
+        """
+        for redaction in self.REDACTIONS:
+            for message in self.MESSAGES:
+                self.check(FIELDS, redaction, message)
+
+    def test_empty_fields(self):
+        """ No field list leaves every buffer type untouched
+        """
+        for message in self.MESSAGES:
+            self.check([], "xxx", message)
+            buffer = bytearray(message.encode(LOG_ENCODING))
+            self.assertIs(filter_datum_bytes([], "xxx", buffer, SEPARATOR),
+                          buffer)
+
+    def test_bytearray_in_place(self):
+        """ A bytearray is modified and returned when the redaction fits
+        """
+        buffer = bytearray(b"name=bobby;email=bob@x.io;ip=1;")
+        result = filter_datum_bytes(FIELDS, "xxx", buffer, SEPARATOR)
+        self.assertIs(result, buffer)
+        self.assertEqual(buffer, b"name=xxx;email=xxx;ip=1;")
+
+    def test_memoryview_in_place(self):
+        """ A writable memoryview is modified and returned when every
+        value is as long as the redaction
+        """
+        buffer = bytearray(b"name=bob;email=a@b;ip=1;")
+        view = memoryview(buffer)
+        result = filter_datum_bytes(FIELDS, "xxx", view, SEPARATOR)
+        self.assertIs(result, view)
+        self.assertEqual(buffer, b"name=xxx;email=xxx;ip=1;")
+
+    def test_shorter_value_makes_new_bytes(self):
+        """ A value shorter than the redaction cannot be done in place
+        """
+        buffer = bytearray(b"name=ab;ip=1;")
+        result = filter_datum_bytes(FIELDS, "xxx", buffer, SEPARATOR)
+        self.assertIsNot(result, buffer)
+        self.assertEqual(result, b"name=xxx;ip=1;")
+        self.assertEqual(buffer, b"name=ab;ip=1;")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -12,6 +12,7 @@ from api.v1.auth.basic_auth import BasicAuth
 from api.v1.auth.session_auth import SessionAuth
 from api.v1.auth.session_exp_auth import SessionExpAuth
 from api.v1.auth.session_db_auth import SessionDBAuth
+from models.base import refresh_all
 
 
 app = Flask(__name__)
@@ -53,6 +54,7 @@ def forbidden(error) -> str:
 def before_request_func():
     """ Before request handler
     """
+    refresh_all()
     if auth:
         excluded_paths = [
             "/api/v1/status/",
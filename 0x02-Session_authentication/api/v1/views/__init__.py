@@ -10,4 +10,7 @@ from api.v1.views.users import *
 
 User.load_from_file()
 
+from models.user_session import UserSession
+UserSession.load_from_file()
+
 from api.v1.views.session_auth import *
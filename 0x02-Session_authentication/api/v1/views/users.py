@@ -2,18 +2,57 @@
 """ Module of Users views
 """
 from api.v1.views import app_views
-from flask import abort, jsonify, request
+from flask import (abort, json, jsonify, request, Response,
+                   stream_with_context)
+from itertools import islice
+from typing import Iterator
 from models.user import User
 
 
+PAGE_SIZE = 100
+PAGE_SIZE_MAX = 1000
+
+
 @app_views.route('/users', methods=['GET'], strict_slashes=False)
 def view_all_users() -> str:
     """ GET /api/v1/users
+    Query parameters (optional):
+      - limit: number of users per page, at most PAGE_SIZE_MAX
+      - cursor: next_cursor of the previous page
     Return:
-      - list of all User objects JSON represented
+      - list of all User objects JSON represented, streamed in chunks
+      - with limit or cursor, one page: {"users": [...], "next_cursor"}
+        where next_cursor is null on the last page
+      - 400 if limit is not a positive integer
+    """
+    if 'limit' not in request.args and 'cursor' not in request.args:
+        return Response(stream_with_context(iter_users_json()),
+                        mimetype='application/json')
+    try:
+        limit = int(request.args.get('limit', PAGE_SIZE))
+    except ValueError:
+        limit = 0
+    if limit <= 0:
+        return jsonify({'error': "limit must be a positive integer"}), 400
+    users, next_cursor = User.page(request.args.get('cursor'),
+                                   min(limit, PAGE_SIZE_MAX))
+    return jsonify({'users': [user.to_json() for user in users],
+                    'next_cursor': next_cursor})
+
+
+def iter_users_json() -> Iterator[str]:
+    """ JSON array of all users, one chunk of PAGE_SIZE users at a time
     """
-    all_users = [user.to_json() for user in User.all()]
-    return jsonify(all_users)
+    users = User.iter_all(PAGE_SIZE)
+    prefix = "["
+    while True:
+        chunk = [json.dumps(user.to_json())
+                 for user in islice(users, PAGE_SIZE)]
+        if not chunk:
+            break
+        yield prefix + ",".join(chunk)
+        prefix = ","
+    yield "[]\n" if prefix == "[" else "]\n"
 
 
 @app_views.route('/users/<user_id>', methods=['GET'], strict_slashes=False)
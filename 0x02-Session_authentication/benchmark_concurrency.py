@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+""" Multi-threaded stress benchmark of the model store
+
+Reader threads run search/all/get while writer threads save and remove
+sessions, in a temporary directory. Results are printed as one JSON
+object per line; any exception raised in a thread is counted as an error
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from models.base import DATA
+from models.user_session import UserSession
+
+
+def populate(count: int) -> list:
+    """ Fill DATA with count sessions, without writing anything
+    """
+    DATA['UserSession'] = {}
+    for i in range(count):
+        session = UserSession(user_id="user{}".format(i % 1000),
+                              session_id="session{}".format(i))
+        DATA['UserSession'][session.id] = session
+    return list(DATA['UserSession'])
+
+
+def reader(stop: threading.Event, ids: list, stats: dict):
+    """ Read until stopped, counting operations
+    """
+    while not stop.is_set():
+        try:
+            op = random.random()
+            if op < 0.45:
+                UserSession.search({'user_id': "user{}".format(
+                    random.randrange(1000))})
+            elif op < 0.9:
+                UserSession.get(random.choice(ids))
+            elif op < 0.95:
+                UserSession.search({'session_id': "missing"})
+            else:
+                UserSession.all()
+            stats['reads'] += 1
+        except Exception:
+            stats['errors'] += 1
+
+
+def writer(stop: threading.Event, stats: dict):
+    """ Save and remove sessions until stopped, counting operations
+    """
+    while not stop.is_set():
+        try:
+            session = UserSession(user_id="user{}".format(
+                random.randrange(1000)), session_id=str(random.random()))
+            session.save()
+            if random.random() < 0.5:
+                session.remove()
+            stats['writes'] += 1
+        except Exception:
+            stats['errors'] += 1
+
+
+def run(count: int, readers: int, writers: int, duration: float) -> dict:
+    """ Run the threads for duration seconds
+    """
+    ids = populate(count)
+    UserSession.save_to_file()
+    stop = threading.Event()
+    stats = [{'reads': 0, 'writes': 0, 'errors': 0}
+             for _ in range(readers + writers)]
+    threads = [threading.Thread(target=reader, args=(stop, ids, stats[i]))
+               for i in range(readers)]
+    threads += [threading.Thread(target=writer,
+                                 args=(stop, stats[readers + i]))
+                for i in range(writers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    total = {key: sum(stat[key] for stat in stats) for key in stats[0]}
+    return {"count": count, "readers": readers, "writers": writers,
+            "reads_per_s": round(total['reads'] / duration),
+            "writes_per_s": round(total['writes'] / duration),
+            "errors": total['errors'],
+            "final_count": UserSession.count()}
+
+
+def main():
+    """ Parse arguments and run the benchmark
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=10000)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--no-fsync", action="store_true",
+                        help="do not fsync journal appends")
+    args = parser.parse_args()
+    UserSession.JOURNAL_FSYNC = not args.no_fsync
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        print(json.dumps(run(args.count, args.readers, args.writers,
+                             args.duration)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+""" Benchmark of the memory held by in-memory models, with and without
+MODELS_COMPACT
+
+Each mode runs in its own interpreter, since the flag is read at import.
+Results are printed as one JSON object per line
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+
+
+def measure(count: int) -> dict:
+    """ Bytes allocated by count users with one session each
+    """
+    from models.base import COMPACT_MODELS, DATA
+    from models.user import User
+    from models.user_session import UserSession
+
+    DATA['User'] = {}
+    DATA['UserSession'] = {}
+    tracemalloc.start()
+    start = time.perf_counter()
+    for i in range(count):
+        user = User(email="user{}@hbtn.io".format(i),
+                    first_name="First{}".format(i % 100),
+                    last_name="Last{}".format(i % 100))
+        user.password = "pwd{}".format(i)
+        DATA['User'][user.id] = user
+        session = UserSession(user_id=user.id,
+                              session_id="session{}".format(i))
+        DATA['UserSession'][session.id] = session
+    elapsed = time.perf_counter() - start
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"compact": COMPACT_MODELS, "count": count,
+            "bytes": size, "bytes_per_user": round(size / count, 1),
+            "build_s": round(elapsed, 3)}
+
+
+def main():
+    """ Run the benchmark in both modes, or in the current one
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=100000)
+    parser.add_argument("--child", action="store_true",
+                        help="measure the mode of this interpreter only")
+    args = parser.parse_args()
+    if args.child:
+        print(json.dumps(measure(args.count)))
+        return
+    for compact in ('0', '1'):
+        env = dict(os.environ, MODELS_COMPACT=compact)
+        subprocess.run([sys.executable, __file__, "--child",
+                        "--count", str(args.count)], env=env, check=True)
+
+
+if __name__ == "__main__":
+    main()
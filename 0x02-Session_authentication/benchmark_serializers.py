@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+""" Benchmark of model file save/load times per serializer
+
+Results are printed as one JSON object per line
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from models.base import DATA
+from models.serializers import SERIALIZERS
+from models.user import User
+
+
+def populate(count: int):
+    """ Fill DATA with count users, without writing anything
+    """
+    DATA['User'] = {}
+    for i in range(count):
+        user = User(email="user{}@hbtn.io".format(i),
+                    first_name="First{}".format(i),
+                    last_name="Last{}".format(i))
+        user.password = "pwd{}".format(i)
+        DATA['User'][user.id] = user
+    User._reindex()
+
+
+def run(count: int, serializer: str) -> dict:
+    """ Time save_to_file and load_from_file for count users
+    """
+    User.SERIALIZER = serializer
+    populate(count)
+    start = time.perf_counter()
+    User.save_to_file()
+    saved = time.perf_counter() - start
+    size = os.path.getsize(User._file_path())
+    start = time.perf_counter()
+    User.load_from_file()
+    loaded = time.perf_counter() - start
+    assert User.count() == count
+    return {
+        'serializer': serializer,
+        'objects': count,
+        'save_seconds': saved,
+        'load_seconds': loaded,
+        'file_bytes': size,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--counts', type=int, nargs='+',
+                        default=[100000, 1000000])
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        for count in args.counts:
+            for serializer in SERIALIZERS:
+                json.dump(run(count, serializer), sys.stdout)
+                sys.stdout.write("\n")
+                sys.stdout.flush()
@@ -1,21 +1,139 @@
 #!/usr/bin/env python3
 """ Base module
 """
-from datetime import datetime
-from typing import TypeVar, List, Iterable
-from os import path
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import TypeVar, List, Iterable, Iterator, Union
+from os import getenv, path
+import atexit
+import bisect
+import fcntl
+import heapq
+import io
 import json
+import os
+import sys
+import threading
 import uuid
+from itertools import islice
+from models.query import Eq, Predicate
+from models.serializers import EPOCH, SERIALIZERS
+from models.store import LazyStore
 
 
 TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
+# MODELS_COMPACT=1 gives the models __slots__ instead of a __dict__:
+# timestamps are kept as epoch seconds and repeated strings are interned
+COMPACT_MODELS = getenv('MODELS_COMPACT', '0') == '1'
+# Slots holding a timestamp as epoch seconds, and the attribute they back
+TIMESTAMP_SLOTS = {'_created_epoch': 'created_at',
+                   '_updated_epoch': 'updated_at'}
+# Attribute names of the slotted classes, in declaration order
+SLOT_ATTRIBUTES = {}
 DATA = {}
+# Secondary indexes: class name -> attribute -> value -> {id: object}
+DATA_INDEXES = {}
+# Indexed values of stored objects: class name -> id -> {attribute: value}
+INDEXED_VALUES = {}
+# Journal entries written since the last snapshot, per class name
+JOURNAL_SIZES = {}
+# Ids of each class in sorted order, for paging: built on first use and
+# kept current by every change to DATA
+ORDERED_IDS = {}
+# Per-class locks: DATA_LOCKS guard in-memory changes to DATA and the
+# indexes, LOCKS guard the files. Readers take neither: they iterate
+# SNAPSHOTS, immutable tuples of the objects rebuilt after each change
+DATA_LOCKS = {}
+SNAPSHOTS = {}
+# In-memory changes whose write is under way, per class name: reloading
+# the files meanwhile would drop them
+IN_FLIGHT = {}
+# Files as last read by this process, per class name: the path and state
+# of the snapshot and how far the journal was applied, see refresh()
+FILE_STATES = {}
+# Per-class persistence locks, and classes being compacted
+LOCKS = {}
+COMPACTING = set()
+COMPACTION_LOCK = threading.Lock()
+# Deferred changes not yet written, and the events waking each flusher
+PENDING = {}
+FLUSHERS = {}
+FLUSH_LOCK = threading.Lock()
+
+
+def compact_str(value: str) -> str:
+    """ Intern a string repeated across objects in compact mode
+    """
+    if COMPACT_MODELS and type(value) is str:
+        return sys.intern(value)
+    return value
 
 
 class Base():
     """ Base class
     """
 
+    # _json_cache holds the to_json() results, dropped by any assignment
+    if COMPACT_MODELS:
+        __slots__ = ('id', '_created_epoch', '_updated_epoch', '_json_cache')
+    else:
+        __slots__ = ('__dict__', '__weakref__', '_json_cache')
+
+    if COMPACT_MODELS:
+
+        @property
+        def created_at(self) -> datetime:
+            """ Creation time, stored as epoch seconds
+            """
+            return EPOCH + timedelta(seconds=self._created_epoch)
+
+        @created_at.setter
+        def created_at(self, value: datetime):
+            """ Store the creation time as epoch seconds
+            """
+            self._created_epoch = int((value - EPOCH).total_seconds())
+
+        @property
+        def updated_at(self) -> datetime:
+            """ Last update time, stored as epoch seconds
+            """
+            return EPOCH + timedelta(seconds=self._updated_epoch)
+
+        @updated_at.setter
+        def updated_at(self, value: datetime):
+            """ Store the last update time as epoch seconds
+            """
+            self._updated_epoch = int((value - EPOCH).total_seconds())
+
+    # Attributes looked up through a hash index by search(), refreshed
+    # when an object is saved, removed or loaded, and when one of them is
+    # assigned on a stored object, so unsaved values are found as well
+    INDEXES = ()
+
+    # save()/remove() append to .db_<Class>.journal instead of rewriting
+    # .db_<Class>.json; the journal is folded into the file in the
+    # background once it holds JOURNAL_COMPACT_THRESHOLD entries
+    JOURNAL = True
+    JOURNAL_COMPACT_THRESHOLD = 1000
+    # fsync every journal append so an acknowledged write survives a crash
+    JOURNAL_FSYNC = True
+
+    # Format of .db_<Class> files, a key of SERIALIZERS: 'json' or the
+    # compact 'binary' (.db_<Class>.bin); see models.serializers.convert
+    SERIALIZER = 'json'
+
+    # Build objects on first access instead of at load_from_file; with
+    # the binary serializer the file is memory-mapped
+    LAZY_LOAD = False
+
+    # Deferred flush: with FLUSH_INTERVAL > 0, save()/remove() only queue
+    # the change and a background thread writes the queue at most every
+    # FLUSH_INTERVAL seconds, or once FLUSH_BATCH_SIZE changes are queued.
+    # Changes made within that window are lost if the process dies before
+    # flush() runs; it also runs at interpreter exit. 0 writes through.
+    FLUSH_INTERVAL = 0
+    FLUSH_BATCH_SIZE = 100
+
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a Base instance
         """
@@ -23,18 +141,43 @@ class Base():
         if DATA.get(s_class) is None:
             DATA[s_class] = {}
 
-        self.id = kwargs.get('id', str(uuid.uuid4()))
-        if kwargs.get('created_at') is not None:
+        self.id = kwargs['id'] if 'id' in kwargs else str(uuid.uuid4())
+        if type(kwargs.get('created_at')) is datetime:
+            self.created_at = kwargs.get('created_at')
+        elif kwargs.get('created_at') is not None:
             self.created_at = datetime.strptime(kwargs.get('created_at'),
                                                 TIMESTAMP_FORMAT)
         else:
             self.created_at = datetime.utcnow()
-        if kwargs.get('updated_at') is not None:
+        if type(kwargs.get('updated_at')) is datetime:
+            self.updated_at = kwargs.get('updated_at')
+        elif kwargs.get('updated_at') is not None:
             self.updated_at = datetime.strptime(kwargs.get('updated_at'),
                                                 TIMESTAMP_FORMAT)
         else:
             self.updated_at = datetime.utcnow()
 
+    def __setattr__(self, name: str, value):
+        """ Set an attribute, dropping the cached JSON forms, and refresh
+        the indexes when it is in INDEXES and the object is in DATA
+
+        Changes made inside a mutable attribute value are not seen
+        """
+        object.__setattr__(self, '_json_cache', None)
+        object.__setattr__(self, name, value)
+        if name in self.__class__.INDEXES and self._is_stored():
+            with self.__class__._data_lock():
+                self.__class__._index(self)
+
+    def _is_stored(self) -> bool:
+        """ Whether DATA holds this very object, without building others
+        """
+        objs = DATA.get(self.__class__.__name__)
+        if objs is None or getattr(self, 'id', None) is None:
+            return False
+        peek = getattr(objs, 'peek', objs.get)
+        return peek(self.id) is self
+
     def __eq__(self, other: TypeVar('Base')) -> bool:
         """ Equality
         """
@@ -44,62 +187,530 @@ class Base():
             return False
         return (self.id == other.id)
 
-    def to_json(self, for_serialization: bool = False) -> dict:
-        """ Convert the object a JSON dictionary
+    def attributes(self) -> dict:
+        """ Attributes of the object by name, whether it is slotted or not
+
+        Without COMPACT_MODELS this is the __dict__ itself: do not modify
         """
+        if not COMPACT_MODELS:
+            return self.__dict__
         result = {}
-        for key, value in self.__dict__.items():
-            if not for_serialization and key[0] == '_':
-                continue
-            if type(value) is datetime:
-                result[key] = value.strftime(TIMESTAMP_FORMAT)
-            else:
-                result[key] = value
+        for name in self.__class__._slot_attributes():
+            try:
+                result[name] = getattr(self, name)
+            except AttributeError:
+                continue  # slot never assigned
+        result.update(getattr(self, '__dict__', {}))
         return result
 
+    @classmethod
+    def _slot_attributes(cls) -> tuple:
+        """ Attribute names declared in the __slots__ of the class and
+        its parents, timestamps under their public name
+        """
+        names = SLOT_ATTRIBUTES.get(cls)
+        if names is None:
+            names = tuple(TIMESTAMP_SLOTS.get(slot, slot)
+                          for klass in reversed(cls.__mro__)
+                          for slot in klass.__dict__.get('__slots__', ())
+                          if slot != '_json_cache')
+            SLOT_ATTRIBUTES[cls] = names
+        return names
+
+    def to_json(self, for_serialization: bool = False) -> dict:
+        """ Convert the object a JSON dictionary
+
+        Both forms are cached until an attribute is assigned, save()
+        included; each call returns a copy of the cached one
+        """
+        cache = getattr(self, '_json_cache', None)
+        if cache is None:
+            serialized = {}
+            for key, value in self.attributes().items():
+                if type(value) is datetime:
+                    serialized[key] = value.strftime(TIMESTAMP_FORMAT)
+                else:
+                    serialized[key] = value
+            public = {key: value for key, value in serialized.items()
+                      if key[0] != '_'}
+            cache = (public, serialized)
+            object.__setattr__(self, '_json_cache', cache)
+        return dict(cache[for_serialization])
+
     @classmethod
     def load_from_file(cls):
         """ Load all objects from file
+
+        The snapshot is read first, then the journal entries written
+        since it was taken are replayed. With LAZY_LOAD, DATA only gets
+        an id index of raw records and objects are built on first access.
+        Changes queued in deferred mode are written first, so the reload
+        keeps them
+        """
+        cls.flush()
+        with cls._file_lock(), cls._lock():
+            cls._load(True, True)
+
+    @classmethod
+    def _load(cls, repair: bool, force: bool) -> bool:
+        """ Load all objects, with the file and class locks held
+
+        Unless forced, DATA is kept when it holds changes not written yet,
+        and False is returned
         """
         s_class = cls.__name__
-        file_path = ".db_{}.json".format(s_class)
-        DATA[s_class] = {}
-        if not path.exists(file_path):
-            return
+        file_path = cls._file_path()
+        serializer = SERIALIZERS[cls.SERIALIZER]
+        # taken before reading: a snapshot replaced meanwhile is seen as
+        # changed by the next refresh()
+        snapshot_state = _file_state(file_path)
+        objs = {}
+        if cls.LAZY_LOAD:
+            objs = LazyStore(cls)
+            if path.exists(file_path):
+                objs = serializer.load_lazy(cls, file_path)
+        elif path.exists(file_path):
+            with open(file_path, 'rb') as f:
+                for obj_json in serializer.load(f):
+                    obj = cls(**obj_json)
+                    objs[obj.id] = obj
+        entries, _ = cls._read_journal(cls._journal_path() + ".compacting",
+                                       0, repair)
+        journal_entries, journal_state = \
+            cls._read_journal(cls._journal_path(), 0, repair)
+        entries += journal_entries
+        cls._replay(entries, objs)
+        with cls._data_lock():
+            if not force and (IN_FLIGHT.get(s_class) or
+                              PENDING.get(s_class)):
+                return False
+            JOURNAL_SIZES[s_class] = len(entries)
+            FILE_STATES[s_class] = {'path': file_path,
+                                    'snapshot': snapshot_state,
+                                    'journal': journal_state}
+            DATA[s_class] = objs
+            DATA_INDEXES.pop(s_class, None)
+            INDEXED_VALUES.pop(s_class, None)
+            ORDERED_IDS.pop(s_class, None)
+            SNAPSHOTS.pop(s_class, None)
+        return True
+
+    @classmethod
+    def _read_journal(cls, journal_path: str, offset: int,
+                      repair: bool) -> tuple:
+        """ Entries of a journal file past offset, and the journal state
+        after the last complete one: (inode, offset), (None, 0) if empty
+
+        With repair, a torn last line, left by a crash during an append,
+        is cut off so later appends start on a clean line. Without it,
+        an incomplete line is left for a later read
+        """
+        entries = []
+        if not path.exists(journal_path):
+            return entries, (None, 0)
+        with open(journal_path, 'rb+' if repair else 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                if not line.endswith(b'\n'):
+                    break
+                entries.append(entry)
+                offset += len(line)
+            if repair:
+                f.truncate(offset)
+            inode = os.fstat(f.fileno()).st_ino
+        return entries, (inode, offset) if offset else (None, 0)
+
+    @classmethod
+    def _replay(cls, entries: List[dict], objs: dict):
+        """ Apply journal entries to objs, a store not yet in DATA
+        """
+        for entry in entries:
+            if entry['op'] == 'put' and cls.LAZY_LOAD:
+                objs.put_raw(entry['id'], entry['obj'])
+            elif entry['op'] == 'put':
+                objs[entry['id']] = cls(**entry['obj'])
+            else:
+                objs.pop(entry['id'], None)
+
+    @classmethod
+    def _apply(cls, entries: List[dict]):
+        """ Apply journal entries to DATA, keeping the indexes current
+        """
+        s_class = cls.__name__
+        objs = [(entry, cls(**entry['obj']) if entry['op'] == 'put'
+                 else None) for entry in entries]
+        with cls._data_lock():
+            for entry, obj in objs:
+                if obj is not None:
+                    if obj.id not in DATA[s_class]:
+                        cls._add_id(obj.id)
+                    DATA[s_class][obj.id] = obj
+                    cls._index(obj)
+                elif DATA[s_class].pop(entry['id'], None) is not None:
+                    cls._drop_id(entry['id'])
+                    cls._unindex(entry['id'])
+            SNAPSHOTS.pop(s_class, None)
+
+    @classmethod
+    def refresh(cls) -> bool:
+        """ Pick up the changes other processes wrote to the files
+
+        Costs two stat() calls when nothing changed. New journal entries
+        are applied one by one; a new snapshot, written by a compaction,
+        means a full reload, put off while a save() of this process is
+        under way. Only classes loaded with load_from_file are tracked.
+        Returns whether the files had changed
+        """
+        state = FILE_STATES.get(cls.__name__)
+        if state is None or not cls._changed(state):
+            return False
+        cls.flush()
+        with cls._file_lock(), cls._lock():
+            cls._catch_up(True)
+        return True
 
-        with open(file_path, 'r') as f:
-            objs_json = json.load(f)
-            for obj_id, obj_json in objs_json.items():
-                DATA[s_class][obj_id] = cls(**obj_json)
+    @classmethod
+    def _changed(cls, state: dict) -> bool:
+        """ Whether the files differ from the state last seen
+        """
+        return _file_state(state['path']) != state['snapshot'] or \
+            _journal_state(cls._journal_path()) != state['journal']
+
+    @classmethod
+    def _catch_up(cls, reload: bool) -> bool:
+        """ Apply the journal entries not seen yet, with the file and
+        class locks held; if the files were rewritten, reload them all
+        when allowed. Returns whether DATA is now up to date
+        """
+        s_class = cls.__name__
+        state = FILE_STATES.get(s_class)
+        if state is None or not cls._changed(state):
+            return True
+        inode, offset = state['journal']
+        current, size = _journal_state(cls._journal_path())
+        if _file_state(state['path']) != state['snapshot'] or \
+                inode not in (None, current) or size < offset:
+            return reload and cls._load(False, False)
+        entries, state['journal'] = \
+            cls._read_journal(cls._journal_path(), offset, False)
+        cls._apply(entries)
+        return True
 
     @classmethod
     def save_to_file(cls):
         """ Save all objects to file
+
+        Writes a full snapshot atomically and drops the journal entries
+        it now covers, after applying those other processes wrote. A
+        journaled class whose files another process rewrote while a save
+        was under way here is not compacted this time.
+        Objects are serialized outside the class lock, so reads and
+        in-memory changes go on meanwhile; journal appends wait for the
+        file lock, which keeps compactions of several processes apart
+        """
+        s_class = cls.__name__
+        file_path = cls._file_path()
+        journal_path = cls._journal_path()
+        compacting_path = journal_path + ".compacting"
+        with COMPACTION_LOCK, cls._file_lock():
+            with cls._lock():
+                if not cls._catch_up(cls.JOURNAL) and cls.JOURNAL:
+                    return
+                objs = cls._snapshot()
+                if path.exists(journal_path):
+                    os.replace(journal_path, compacting_path)
+                JOURNAL_SIZES[s_class] = 0
+                if s_class in FILE_STATES:
+                    FILE_STATES[s_class]['journal'] = (None, 0)
+            snapshot = io.BytesIO()
+            SERIALIZERS[cls.SERIALIZER].dump(objs, snapshot)
+
+            tmp_path = file_path + ".tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(snapshot.getbuffer())
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, file_path)
+            if path.exists(compacting_path):
+                os.remove(compacting_path)
+            if s_class in FILE_STATES:
+                FILE_STATES[s_class].update(path=file_path,
+                                            snapshot=_file_state(file_path))
+
+    @classmethod
+    def _file_path(cls) -> str:
+        """ Path of the snapshot file of the class
+        """
+        return ".db_{}{}".format(cls.__name__,
+                                 SERIALIZERS[cls.SERIALIZER].EXTENSION)
+
+    @classmethod
+    def _journal_path(cls) -> str:
+        """ Path of the append-only journal of the class
+        """
+        return ".db_{}.journal".format(cls.__name__)
+
+    @classmethod
+    def _lock(cls) -> threading.RLock:
+        """ Lock guarding the persistence of the class
+        """
+        return LOCKS.setdefault(cls.__name__, threading.RLock())
+
+    @classmethod
+    @contextmanager
+    def _file_lock(cls) -> Iterator[None]:
+        """ Lock on .db_<Class>.lock, shared with the other processes
+        using the files, around journal appends, compactions and loads;
+        taken before the class lock
+        """
+        with open(".db_{}.lock".format(cls.__name__), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+
+    @classmethod
+    def _data_lock(cls) -> threading.RLock:
+        """ Lock guarding in-memory changes to the objects of the class
+        """
+        return DATA_LOCKS.setdefault(cls.__name__, threading.RLock())
+
+    @classmethod
+    def _snapshot(cls) -> tuple:
+        """ Immutable view of all objects, rebuilt after each change
+
+        Readers iterate it without locking while writers go on
+        """
+        s_class = cls.__name__
+        snapshot = SNAPSHOTS.get(s_class)
+        if snapshot is None:
+            with cls._data_lock():
+                snapshot = SNAPSHOTS.get(s_class)
+                if snapshot is None:
+                    snapshot = tuple(DATA[s_class].values())
+                    SNAPSHOTS[s_class] = snapshot
+        return snapshot
+
+    @classmethod
+    def _persist(cls, entry: dict):
+        """ Record a change, in the journal or by rewriting the file
+
+        With a positive FLUSH_INTERVAL the change is only queued, and the
+        background flusher writes it with the others
+        """
+        if cls.FLUSH_INTERVAL <= 0:
+            cls._write([entry])
+            return
+        s_class = cls.__name__
+        with cls._lock():
+            pending = PENDING.setdefault(s_class, [])
+            pending.append(entry)
+            flusher = FLUSHERS.get(s_class)
+            if flusher is None:
+                flusher = threading.Event()
+                FLUSHERS[s_class] = flusher
+                threading.Thread(target=cls._flush_loop, args=(flusher,),
+                                 daemon=True).start()
+            if len(pending) >= cls.FLUSH_BATCH_SIZE:
+                flusher.set()
+
+    @classmethod
+    def _write(cls, entries: List[dict]):
+        """ Write changes: one journal append, or one full rewrite
+        """
+        if not cls.JOURNAL:
+            cls.save_to_file()
+            return
+        s_class = cls.__name__
+        lines = "".join(json.dumps(entry) + "\n" for entry in entries)
+        with cls._file_lock(), cls._lock():
+            with open(cls._journal_path(), 'a') as f:
+                before = _journal_state(f.fileno())
+                f.write(lines)
+                f.flush()
+                if cls.JOURNAL_FSYNC:
+                    os.fsync(f.fileno())
+                state = FILE_STATES.get(s_class)
+                if state is not None and state['journal'] == before:
+                    # nothing new from other processes: skip our entries
+                    state['journal'] = _journal_state(f.fileno())
+            JOURNAL_SIZES[s_class] = \
+                JOURNAL_SIZES.get(s_class, 0) + len(entries)
+            if JOURNAL_SIZES[s_class] < cls.JOURNAL_COMPACT_THRESHOLD or \
+                    s_class in COMPACTING:
+                return
+            COMPACTING.add(s_class)
+        threading.Thread(target=cls._compact, daemon=True).start()
+
+    @classmethod
+    def flush(cls):
+        """ Write the changes queued by save()/remove() in deferred mode
         """
         s_class = cls.__name__
-        file_path = ".db_{}.json".format(s_class)
-        objs_json = {}
-        for obj_id, obj in DATA[s_class].items():
-            objs_json[obj_id] = obj.to_json(True)
+        with FLUSH_LOCK:
+            with cls._lock():
+                entries = PENDING.pop(s_class, None)
+            if entries:
+                cls._write(entries)
 
-        with open(file_path, 'w') as f:
-            json.dump(objs_json, f)
+    @classmethod
+    def _flush_loop(cls, flusher: threading.Event):
+        """ Background flusher: writes every FLUSH_INTERVAL seconds, or
+        as soon as FLUSH_BATCH_SIZE changes are queued
+        """
+        while True:
+            flusher.wait(cls.FLUSH_INTERVAL)
+            flusher.clear()
+            cls.flush()
+
+    @classmethod
+    def _compact(cls):
+        """ Background compaction of the journal into a snapshot
+        """
+        try:
+            cls.save_to_file()
+        finally:
+            COMPACTING.discard(cls.__name__)
 
     def save(self):
         """ Save current object
         """
         s_class = self.__class__.__name__
         self.updated_at = datetime.utcnow()
-        DATA[s_class][self.id] = self
-        self.__class__.save_to_file()
+        with self.__class__._data_lock():
+            IN_FLIGHT[s_class] = IN_FLIGHT.get(s_class, 0) + 1
+            if self.id not in DATA[s_class]:
+                self.__class__._add_id(self.id)
+            DATA[s_class][self.id] = self
+            self.__class__._index(self)
+            SNAPSHOTS.pop(s_class, None)
+        try:
+            self.__class__._persist({'op': 'put', 'id': self.id,
+                                     'obj': self.to_json(True)})
+        finally:
+            with self.__class__._data_lock():
+                IN_FLIGHT[s_class] -= 1
 
     def remove(self):
         """ Remove object
         """
         s_class = self.__class__.__name__
-        if DATA[s_class].get(self.id) is not None:
-            del DATA[s_class][self.id]
-            self.__class__.save_to_file()
+        with self.__class__._data_lock():
+            if DATA[s_class].pop(self.id, None) is None:
+                return
+            IN_FLIGHT[s_class] = IN_FLIGHT.get(s_class, 0) + 1
+            self.__class__._drop_id(self.id)
+            self.__class__._unindex(self.id)
+            SNAPSHOTS.pop(s_class, None)
+        try:
+            self.__class__._persist({'op': 'delete', 'id': self.id})
+        finally:
+            with self.__class__._data_lock():
+                IN_FLIGHT[s_class] -= 1
+
+    @classmethod
+    def _reindex(cls):
+        """ Rebuild the secondary indexes from DATA
+
+        A LazyStore answers from its raw records without building objects
+        """
+        s_class = cls.__name__
+        DATA_INDEXES[s_class] = {attr: {} for attr in cls.INDEXES}
+        INDEXED_VALUES[s_class] = {}
+        objs = DATA[s_class]
+        attributes = getattr(objs, 'attributes', None)
+        for obj_id in objs:
+            if attributes is None:
+                obj = objs[obj_id]
+                values = {attr: getattr(obj, attr, None)
+                          for attr in cls.INDEXES}
+            else:
+                values = attributes(obj_id, cls.INDEXES)
+            cls._add_to_index(obj_id, values)
+
+    @classmethod
+    def _indexes(cls) -> dict:
+        """ Secondary indexes of the class, built on first use
+        """
+        s_class = cls.__name__
+        if cls.INDEXES and DATA_INDEXES.get(s_class) is None:
+            with cls._data_lock():
+                if DATA_INDEXES.get(s_class) is None:
+                    cls._reindex()
+        return DATA_INDEXES.get(s_class, {})
+
+    @classmethod
+    def _index(cls, obj: TypeVar('Base')):
+        """ Add or refresh an object in the secondary indexes
+        """
+        if not cls.INDEXES or DATA_INDEXES.get(cls.__name__) is None:
+            return  # not built yet; _indexes() will include the object
+        cls._unindex(obj.id)
+        cls._add_to_index(obj.id, {attr: getattr(obj, attr, None)
+                                   for attr in cls.INDEXES})
+
+    @classmethod
+    def _add_to_index(cls, obj_id: str, values: dict):
+        """ Record the indexed values of one object
+        """
+        s_class = cls.__name__
+        indexed = {}
+        for attr, value in values.items():
+            try:
+                DATA_INDEXES[s_class][attr].setdefault(value, {})[obj_id] = 1
+            except TypeError:
+                continue  # unhashable values are only found by scanning
+            indexed[attr] = value
+        INDEXED_VALUES[s_class][obj_id] = indexed
+
+    @classmethod
+    def _unindex(cls, obj_id: str):
+        """ Drop an object from the secondary indexes
+        """
+        s_class = cls.__name__
+        if DATA_INDEXES.get(s_class) is None:
+            return
+        values = INDEXED_VALUES[s_class].pop(obj_id, None)
+        if values is None:
+            return
+        for attr, value in values.items():
+            bucket = DATA_INDEXES[s_class][attr].get(value)
+            if bucket is not None:
+                bucket.pop(obj_id, None)
+                if not bucket:
+                    del DATA_INDEXES[s_class][attr][value]
+
+    @classmethod
+    def _ordered_ids(cls) -> List[str]:
+        """ Sorted ids of the class, built on first use; call with the
+        data lock held
+        """
+        s_class = cls.__name__
+        ids = ORDERED_IDS.get(s_class)
+        if ids is None:
+            ids = sorted(DATA[s_class])
+            ORDERED_IDS[s_class] = ids
+        return ids
+
+    @classmethod
+    def _add_id(cls, obj_id: str):
+        """ Insert a new id in the sorted ids, once they are built
+        """
+        ids = ORDERED_IDS.get(cls.__name__)
+        if ids is not None:
+            bisect.insort(ids, obj_id)
+
+    @classmethod
+    def _drop_id(cls, obj_id: str):
+        """ Remove an id from the sorted ids, once they are built
+        """
+        ids = ORDERED_IDS.get(cls.__name__)
+        if ids is not None:
+            i = bisect.bisect_left(ids, obj_id)
+            if i < len(ids) and ids[i] == obj_id:
+                del ids[i]
 
     @classmethod
     def count(cls) -> int:
@@ -114,6 +725,37 @@ class Base():
         """
         return cls.search()
 
+    @classmethod
+    def page(cls, cursor: str = None, limit: int = 100) -> tuple:
+        """ Up to limit objects with an id after cursor, in id order, and
+        the cursor of the next page, None after the last one
+
+        Ids are ordered, so objects saved or removed between two calls
+        neither shift nor repeat the others
+        """
+        s_class = cls.__name__
+        with cls._data_lock():
+            ids = cls._ordered_ids()
+            start = 0 if cursor is None else bisect.bisect_right(ids, cursor)
+            page_ids = ids[start:start + limit]
+            last = start + limit >= len(ids)
+            objs = DATA[s_class]
+        page = [objs.get(obj_id) for obj_id in page_ids]
+        page = [obj for obj in page if obj is not None]
+        return page, None if last or not page_ids else page_ids[-1]
+
+    @classmethod
+    def iter_all(cls, batch_size: int = 100) -> Iterator[TypeVar('Base')]:
+        """ Iterate over all objects in id order, one page at a time,
+        without copying them all first
+        """
+        cursor = None
+        while True:
+            page, cursor = cls.page(cursor, batch_size)
+            yield from page
+            if cursor is None:
+                return
+
     @classmethod
     def get(cls, id: str) -> TypeVar('Base'):
         """ Return one object by ID
@@ -124,14 +766,117 @@ class Base():
     @classmethod
     def search(cls, attributes: dict = {}) -> List[TypeVar('Base')]:
         """ Search all objects with matching attributes
+
+        Shorthand for query() with one Eq per attribute. Current values
+        are matched, saved or not; for attributes in INDEXES this relies
+        on them being assigned, changes inside a mutable value are missed
+        """
+        return cls.query(*(Eq(k, v) for k, v in attributes.items()))
+
+    @classmethod
+    def query(cls, *predicates: Predicate, order_by: str = None,
+              limit: int = None) -> List[TypeVar('Base')]:
+        """ Objects meeting all predicates (see models.query)
+
+        order_by names an attribute, '-' first for descending order; None
+        values come last. Of the predicates on INDEXES, the one matching
+        the fewest ids picks the candidates; without one the snapshot is
+        scanned, or the ids in order for order_by='id'. Unless results
+        must be sorted, the scan stops after limit matches
         """
         s_class = cls.__name__
-        def _search(obj):
-            if len(attributes) == 0:
-                return True
-            for k, v in attributes.items():
-                if (getattr(obj, k) != v):
-                    return False
-            return True
-        
-        return list(filter(_search, DATA[s_class].values()))
+        obj_ids = None
+        indexes = cls._indexes()
+        with cls._data_lock():
+            for predicate in predicates:
+                if predicate.attr not in indexes:
+                    continue
+                ids = predicate.index_ids(indexes[predicate.attr])
+                if ids is not None and \
+                        (obj_ids is None or len(ids) < len(obj_ids)):
+                    obj_ids = ids
+            if obj_ids is not None:
+                obj_ids = tuple(obj_ids)
+            objs = DATA[s_class]
+
+        in_order = order_by is None
+        if obj_ids is not None:
+            # objects removed since the ids were read are skipped
+            candidates = (objs.get(obj_id) for obj_id in obj_ids)
+            candidates = (obj for obj in candidates if obj is not None)
+        elif order_by == 'id':
+            candidates = cls.iter_all()
+            in_order = True
+        else:
+            candidates = cls._snapshot()
+        if not predicates:
+            results = iter(candidates)
+        elif len(predicates) == 1:
+            results = filter(predicates[0].matches, candidates)
+        else:
+            results = (obj for obj in candidates
+                       if all(predicate.matches(obj)
+                              for predicate in predicates))
+        if in_order:
+            return list(islice(results, limit))
+
+        attr = order_by.lstrip('-')
+        reverse = order_by.startswith('-')
+
+        def key(obj):
+            value = getattr(obj, attr)
+            return (value is None) != reverse, value
+
+        if limit is None:
+            return sorted(results, key=key, reverse=reverse)
+        if reverse:
+            return heapq.nlargest(limit, results, key=key)
+        return heapq.nsmallest(limit, results, key=key)
+
+
+def refresh_all():
+    """ Pick up the changes other processes wrote to the loaded models
+    """
+    for cls in _subclasses(Base):
+        if cls.__name__ in FILE_STATES:
+            cls.refresh()
+
+
+@atexit.register
+def flush_all():
+    """ Write the deferred changes of every model
+    """
+    for s_class in list(PENDING):
+        if PENDING.get(s_class):
+            for cls in _subclasses(Base):
+                if cls.__name__ == s_class:
+                    cls.flush()
+
+
+def _file_state(file_path: str) -> tuple:
+    """ Inode, modification time and size of a file, None if missing
+    """
+    try:
+        st = os.stat(file_path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def _journal_state(journal: Union[str, int]) -> tuple:
+    """ Inode and size of a journal, by path or descriptor; (None, 0) if
+    it is missing or empty
+    """
+    try:
+        st = os.stat(journal)
+    except FileNotFoundError:
+        return (None, 0)
+    return (st.st_ino, st.st_size) if st.st_size else (None, 0)
+
+
+def _subclasses(cls: type) -> Iterable[type]:
+    """ All subclasses of a class, recursively
+    """
+    for subclass in cls.__subclasses__():
+        yield subclass
+        yield from _subclasses(subclass)
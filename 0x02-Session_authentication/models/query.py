@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+""" Query predicates module
+
+Conditions on one attribute, combined by Base.query. Those that can be
+answered from a hash index give the matching ids, so the planner can
+start from the most selective one
+"""
+from typing import Any, Iterable, Optional, TypeVar
+
+
+class Predicate():
+    """ Condition on one attribute of an object
+    """
+
+    def __init__(self, attr: str):
+        """ Initialize a condition on attr
+        """
+        self.attr = attr
+
+    def matches(self, obj: TypeVar('Base')) -> bool:
+        """ Whether the object meets the condition
+        """
+        raise NotImplementedError
+
+    def index_ids(self, index: dict) -> Optional[Iterable[str]]:
+        """ Ids meeting the condition according to a hash index of the
+        attribute (value -> {id: 1}), None if the index cannot answer
+        """
+        return None
+
+
+class Eq(Predicate):
+    """ attr == value
+    """
+
+    def __init__(self, attr: str, value: Any):
+        """ Initialize the condition
+        """
+        super().__init__(attr)
+        self.value = value
+
+    def matches(self, obj: TypeVar('Base')) -> bool:
+        """ Whether the attribute equals the value
+        """
+        return getattr(obj, self.attr) == self.value
+
+    def index_ids(self, index: dict) -> Optional[Iterable[str]]:
+        """ Ids indexed under the value
+        """
+        try:
+            return index.get(self.value, {})
+        except TypeError:
+            return None  # unhashable: only found by scanning
+
+
+class In(Predicate):
+    """ attr is one of values
+    """
+
+    def __init__(self, attr: str, values: Iterable[Any]):
+        """ Initialize the condition
+        """
+        super().__init__(attr)
+        self.values = list(values)
+
+    def matches(self, obj: TypeVar('Base')) -> bool:
+        """ Whether the attribute is one of the values
+        """
+        return getattr(obj, self.attr) in self.values
+
+    def index_ids(self, index: dict) -> Optional[Iterable[str]]:
+        """ Ids indexed under any of the values
+        """
+        ids = {}
+        try:
+            for value in self.values:
+                ids.update(index.get(value, {}))
+        except TypeError:
+            return None
+        return ids
+
+
+class Prefix(Predicate):
+    """ attr is a string starting with prefix
+    """
+
+    def __init__(self, attr: str, prefix: str):
+        """ Initialize the condition
+        """
+        super().__init__(attr)
+        self.prefix = prefix
+
+    def matches(self, obj: TypeVar('Base')) -> bool:
+        """ Whether the attribute starts with the prefix
+        """
+        value = getattr(obj, self.attr)
+        return type(value) is str and value.startswith(self.prefix)
+
+
+class Range(Predicate):
+    """ low <= attr < high, either bound being optional
+
+    Meant for timestamps, but works with any ordered values
+    """
+
+    def __init__(self, attr: str, low: Any = None, high: Any = None):
+        """ Initialize the condition
+        """
+        super().__init__(attr)
+        self.low = low
+        self.high = high
+
+    def matches(self, obj: TypeVar('Base')) -> bool:
+        """ Whether the attribute is within the bounds
+        """
+        value = getattr(obj, self.attr)
+        if value is None:
+            return False
+        if self.low is not None and value < self.low:
+            return False
+        return self.high is None or value < self.high
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+""" Serializers for the model files
+"""
+from datetime import datetime, timedelta
+from typing import BinaryIO, Iterable, Iterator, TypeVar
+from os import path
+import json
+import mmap
+import struct
+from models.store import LazyStore
+
+
+EPOCH = datetime(1970, 1, 1)
+UINT16 = struct.Struct("<H")
+UINT32 = struct.Struct("<I")
+INT64 = struct.Struct("<q")
+FIELD_HEADER = struct.Struct("<HB")
+
+
+class JSONSerializer():
+    """ Text JSON file: one object mapping ids to serialized objects
+    """
+
+    EXTENSION = ".json"
+
+    def dump(self, objs: Iterable[TypeVar('Base')], f: BinaryIO):
+        """ Write objects to a binary file object
+        """
+        objs_json = {obj.id: obj.to_json(True) for obj in objs}
+        f.write(json.dumps(objs_json).encode('utf-8'))
+
+    def load(self, f: BinaryIO) -> Iterator[dict]:
+        """ Read the keyword arguments of each object
+        """
+        yield from json.load(f).values()
+
+    def load_lazy(self, cls: type, file_path: str) -> LazyStore:
+        """ Index the file by id, keeping the parsed records unbuilt
+        """
+        store = LazyStore(cls)
+        with open(file_path, 'rb') as f:
+            for obj_id, obj_json in json.load(f).items():
+                store.put_raw(obj_id, obj_json)
+        return store
+
+
+class BinarySerializer():
+    """ Compact binary file with epoch-integer timestamps
+
+    Layout: MAGIC, the table of attribute names, then one record per
+    object, prefixed with its byte length so it can be skipped. A record
+    is a count of fields followed by (name index, type tag, value)
+    """
+
+    EXTENSION = ".bin"
+    MAGIC = b"BDB\x01"
+
+    NONE, STR, INT, DATETIME, FLOAT, BOOL, JSON = range(7)
+
+    def dump(self, objs: Iterable[TypeVar('Base')], f: BinaryIO):
+        """ Write objects to a binary file object
+        """
+        objs = list(objs)
+        names = {}
+        for obj in objs:
+            for key in obj.attributes():
+                names.setdefault(key, len(names))
+        f.write(self.MAGIC)
+        f.write(struct.pack("<H", len(names)))
+        for key in names:
+            f.write(self._pack_str(key))
+        for obj in objs:
+            body = self.encode(obj.attributes(), names)
+            f.write(struct.pack("<I", len(body)))
+            f.write(body)
+
+    def load(self, f: BinaryIO) -> Iterator[dict]:
+        """ Read the keyword arguments of each object
+        """
+        data = f.read()
+        names, offset = self.read_header(data)
+        while offset < len(data):
+            size, = UINT32.unpack_from(data, offset)
+            offset += 4
+            yield self.decode(data, offset, names)
+            offset += size
+
+    def load_lazy(self, cls: type, file_path: str) -> LazyStore:
+        """ Map the file in memory and index record offsets by id
+
+        Only the id of each record is decoded; the rest is read from the
+        mapping when the object is first accessed
+        """
+        with open(file_path, 'rb') as f:
+            if path.getsize(file_path) == 0:
+                return LazyStore(cls)
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        names, offset = self.read_header(data)
+        store = LazyStore(cls, lambda record: self.decode(data, record,
+                                                          names))
+        while offset < len(data):
+            size, = UINT32.unpack_from(data, offset)
+            offset += 4
+            store.put_raw(self.decode(data, offset, names, 'id')['id'],
+                          offset)
+            offset += size
+        return store
+
+    def read_header(self, data: bytes) -> tuple:
+        """ Return the attribute names and the offset of the first record
+        """
+        if bytes(data[:len(self.MAGIC)]) != self.MAGIC:
+            raise ValueError("not a binary model file")
+        offset = len(self.MAGIC)
+        count, = struct.unpack_from("<H", data, offset)
+        offset += 2
+        names = []
+        for _ in range(count):
+            name, offset = self._unpack_str(data, offset)
+            names.append(name)
+        return names, offset
+
+    def encode(self, attributes: dict, names: dict) -> bytes:
+        """ Encode the attributes of one object as a record body
+        """
+        parts = [struct.pack("<H", len(attributes))]
+        for key, value in attributes.items():
+            parts.append(struct.pack("<H", names[key]))
+            if value is None:
+                parts.append(struct.pack("<B", self.NONE))
+            elif type(value) is str:
+                parts.append(struct.pack("<B", self.STR))
+                parts.append(self._pack_str(value, "<I"))
+            elif type(value) is bool:
+                parts.append(struct.pack("<BB", self.BOOL, value))
+            elif type(value) is int:
+                parts.append(struct.pack("<Bq", self.INT, value))
+            elif type(value) is float:
+                parts.append(struct.pack("<Bd", self.FLOAT, value))
+            elif type(value) is datetime:
+                seconds = (value - EPOCH) // timedelta(seconds=1)
+                parts.append(struct.pack("<Bq", self.DATETIME, seconds))
+            else:
+                parts.append(struct.pack("<B", self.JSON))
+                parts.append(self._pack_str(json.dumps(value), "<I"))
+        return b"".join(parts)
+
+    def decode(self, data: bytes, offset: int, names: list,
+               until: str = None) -> dict:
+        """ Decode the record body starting at offset
+
+        With until, decoding stops after that attribute
+        """
+        # the tags as locals: the loop compares each field against them
+        NONE, STR, INT, DATETIME, FLOAT, BOOL = (
+            self.NONE, self.STR, self.INT, self.DATETIME, self.FLOAT,
+            self.BOOL)
+        count, = UINT16.unpack_from(data, offset)
+        offset += 2
+        result = {}
+        for _ in range(count):
+            index, tag = FIELD_HEADER.unpack_from(data, offset)
+            offset += 3
+            if tag == STR:
+                size, = UINT32.unpack_from(data, offset)
+                offset += 4
+                value = data[offset:offset + size].decode('utf-8')
+                offset += size
+            elif tag == DATETIME:
+                seconds, = INT64.unpack_from(data, offset)
+                offset += 8
+                value = EPOCH + timedelta(seconds=seconds)
+            elif tag == NONE:
+                value = None
+            elif tag == INT:
+                value, = INT64.unpack_from(data, offset)
+                offset += 8
+            elif tag == FLOAT:
+                value, = struct.unpack_from("<d", data, offset)
+                offset += 8
+            elif tag == BOOL:
+                value = bool(data[offset])
+                offset += 1
+            else:  # JSON
+                size, = UINT32.unpack_from(data, offset)
+                offset += 4
+                value = json.loads(data[offset:offset + size])
+                offset += size
+            result[names[index]] = value
+            if names[index] == until:
+                break
+        return result
+
+    @staticmethod
+    def _pack_str(value: str, size_format: str = "<H") -> bytes:
+        """ Length-prefixed UTF-8 string
+        """
+        encoded = value.encode('utf-8')
+        return struct.pack(size_format, len(encoded)) + encoded
+
+    @staticmethod
+    def _unpack_str(data: bytes, offset: int) -> tuple:
+        """ Read a string written by _pack_str, return it and the new offset
+        """
+        size, = UINT16.unpack_from(data, offset)
+        offset += 2
+        return data[offset:offset + size].decode('utf-8'), offset + size
+
+
+SERIALIZERS = {
+    'json': JSONSerializer(),
+    'binary': BinarySerializer(),
+}
+
+
+def convert(cls: type, source: str, target: str) -> str:
+    """ Rewrite the file of a model from one serializer to another
+
+    Returns the path of the written file
+    """
+    source_serializer = SERIALIZERS[source]
+    target_serializer = SERIALIZERS[target]
+    s_class = cls.__name__
+    source_path = ".db_{}{}".format(s_class, source_serializer.EXTENSION)
+    target_path = ".db_{}{}".format(s_class, target_serializer.EXTENSION)
+    with open(source_path, 'rb') as f:
+        objs = [cls(**kwargs) for kwargs in source_serializer.load(f)]
+    with open(target_path, 'wb') as f:
+        target_serializer.dump(objs, f)
+    return target_path
+
+
+if __name__ == "__main__":
+    import argparse
+    import importlib
+
+    parser = argparse.ArgumentParser(description="Convert a model file")
+    parser.add_argument('model', help="e.g. models.user.User")
+    parser.add_argument('source', choices=SERIALIZERS)
+    parser.add_argument('target', choices=SERIALIZERS)
+    args = parser.parse_args()
+    module_name, class_name = args.model.rsplit('.', 1)
+    model = getattr(importlib.import_module(module_name), class_name)
+    print(convert(model, args.source, args.target))
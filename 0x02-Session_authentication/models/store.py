@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+""" Lazy object store module
+"""
+from collections.abc import MutableMapping
+import threading
+from typing import Callable, Iterable, Iterator, TypeVar
+
+
+class LazyStore(MutableMapping):
+    """ Mapping of id to object whose objects are built on first access
+
+    Entries start as raw records: the keyword arguments of the object, or
+    an offset that decode turns into them. Reading an entry builds the
+    object once and keeps it in place, so the order of ids is preserved.
+    Concurrent readers of an entry get the same object: it is built
+    outside the store lock and only the first one built is kept
+    """
+
+    class Raw():
+        """ Record not yet turned into an object
+        """
+        __slots__ = ('record',)
+
+        def __init__(self, record):
+            """ Wrap a raw record
+            """
+            self.record = record
+
+    def __init__(self, cls: type, decode: Callable[[int], dict] = None):
+        """ Initialize an empty store for objects of cls
+        """
+        self._cls = cls
+        self._decode = decode
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def put_raw(self, obj_id: str, record):
+        """ Add an entry from keyword arguments, or a decode offset
+        """
+        with self._lock:
+            self._entries[obj_id] = LazyStore.Raw(record)
+
+    def attributes(self, obj_id: str, names: Iterable[str]) -> dict:
+        """ Values of some attributes, read from the raw record if possible
+
+        Timestamps are stored as text or epochs, so they come from the
+        built object
+        """
+        entry = self._entries[obj_id]
+        if type(entry) is not LazyStore.Raw or \
+                'created_at' in names or 'updated_at' in names:
+            obj = self[obj_id]
+            return {name: getattr(obj, name, None) for name in names}
+        kwargs = self._kwargs(entry)
+        return {name: kwargs.get(name) for name in names}
+
+    def peek(self, obj_id: str):
+        """ The entry of an id as stored, object or raw record, None if
+        missing; nothing is built
+        """
+        return self._entries.get(obj_id)
+
+    def _kwargs(self, entry: 'LazyStore.Raw') -> dict:
+        """ Keyword arguments of a raw entry
+        """
+        if type(entry.record) is int:
+            return self._decode(entry.record)
+        return entry.record
+
+    def __getitem__(self, obj_id: str) -> TypeVar('Base'):
+        """ Return the object, building it on first access
+        """
+        entry = self._entries[obj_id]
+        if type(entry) is not LazyStore.Raw:
+            return entry
+        obj = self._cls(**self._kwargs(entry))
+        with self._lock:
+            if self._entries.get(obj_id) is entry:
+                self._entries[obj_id] = obj
+                return obj
+        # built, replaced or removed meanwhile: read the entry again
+        return self[obj_id]
+
+    def __setitem__(self, obj_id: str, obj: TypeVar('Base')):
+        """ Store a built object
+        """
+        with self._lock:
+            self._entries[obj_id] = obj
+
+    def __delitem__(self, obj_id: str):
+        """ Remove an entry
+        """
+        with self._lock:
+            del self._entries[obj_id]
+
+    def pop(self, obj_id: str, *default):
+        """ Remove an entry without building it
+
+        Returns the object if it was built, else its LazyStore.Raw
+        record; default, or KeyError, when the id is missing
+        """
+        with self._lock:
+            return self._entries.pop(obj_id, *default)
+
+    def __contains__(self, obj_id: object) -> bool:
+        """ Membership test that does not build the object
+        """
+        return obj_id in self._entries
+
+    def __iter__(self) -> Iterator[str]:
+        """ Iterate over ids
+        """
+        return iter(self._entries)
+
+    def __len__(self) -> int:
+        """ Number of entries, built or not
+        """
+        return len(self._entries)
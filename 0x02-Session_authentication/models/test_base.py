@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+""" Tests of the persistence of Base models
+
+Run from 0x02-Session_authentication: python -m unittest models.test_base
+"""
+import os
+import tempfile
+import unittest
+from models.base import DATA, PENDING
+from models.user import User
+
+
+class TestDeferredReload(unittest.TestCase):
+    """ load_from_file keeps the changes queued in deferred mode
+    """
+
+    def setUp(self):
+        """ Work in an empty directory with a long flush interval
+        """
+        self.cwd = os.getcwd()
+        self.directory = tempfile.TemporaryDirectory()
+        os.chdir(self.directory.name)
+        User.FLUSH_INTERVAL = 30
+        User.load_from_file()
+
+    def tearDown(self):
+        """ Restore the class settings and the working directory
+        """
+        User.flush()
+        del User.FLUSH_INTERVAL
+        if 'JOURNAL' in User.__dict__:
+            del User.JOURNAL
+        os.chdir(self.cwd)
+        self.directory.cleanup()
+
+    def check_reload_keeps(self):
+        """ A queued save survives a reload, in memory and on disk
+        """
+        user = User(email="bob@hbtn.io")
+        user.save()
+        self.assertTrue(PENDING.get('User'))
+        User.load_from_file()
+        self.assertFalse(PENDING.get('User'))
+        self.assertEqual(User.get(user.id), user)
+
+        DATA['User'] = {}
+        User.load_from_file()
+        self.assertEqual(User.get(user.id), user)
+
+    def test_journal(self):
+        """ Journaled class
+        """
+        self.check_reload_keeps()
+
+    def test_no_journal(self):
+        """ Class rewriting its file on each write
+        """
+        User.JOURNAL = False
+        self.check_reload_keeps()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,21 +2,26 @@
 """ User module
 """
 import hashlib
-from models.base import Base
+from models.base import Base, COMPACT_MODELS, compact_str
 
 
 class User(Base):
     """ User class
     """
 
+    INDEXES = ('email',)
+
+    if COMPACT_MODELS:
+        __slots__ = ('email', '_password', 'first_name', 'last_name')
+
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a User instance
         """
         super().__init__(*args, **kwargs)
         self.email = kwargs.get('email')
         self._password = kwargs.get('_password')
-        self.first_name = kwargs.get('first_name')
-        self.last_name = kwargs.get('last_name')
+        self.first_name = compact_str(kwargs.get('first_name'))
+        self.last_name = compact_str(kwargs.get('last_name'))
 
     @property
     def password(self) -> str:
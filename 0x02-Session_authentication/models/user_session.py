@@ -1,13 +1,19 @@
 #!/usr/bin/env python3
 """ Module for User sessions"""
 
-from models.base import Base
+from models.base import Base, COMPACT_MODELS, compact_str
 
 
 class UserSession(Base):
     """ UserSession class to store session information """
+
+    INDEXES = ('session_id', 'user_id')
+
+    if COMPACT_MODELS:
+        __slots__ = ('user_id', 'session_id')
+
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a UserSession instance """
         super().__init__(*args, **kwargs)
-        self.user_id = kwargs.get('user_id')
+        self.user_id = compact_str(kwargs.get('user_id'))
         self.session_id = kwargs.get('session_id')